@@ -1,21 +1,145 @@
-from flask import Flask, render_template, flash, request, redirect, url_for, jsonify
-from reddit import RedditQueue, get_subreddits_from_url
+from flask import Flask, render_template, flash, request, redirect, url_for, jsonify, session, Response, stream_with_context, send_file, abort, g
+from flask.json.provider import DefaultJSONProvider
+from reddit import RedditQueue, get_subreddits_from_url, create_fetcher, create_scheduler
+from post import Post
+from media_cache import MediaCache
+from metrics import registry, REQUEST_SECONDS, QUEUE_METRICS
+from fetch_daemon import RemoteQueue, daemon_authkey
+from functools import lru_cache
+import gzip
+import hashlib
 import json
 import os
 import logging
+import threading
 import time
 
+class PostJSONProvider(DefaultJSONProvider):
+    """Serialize Post objects straight from their slots in jsonify and |tojson"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Post):
+            data = o.to_dict()
+            return media_cache.rewrite(data) if media_cache else data
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = PostJSONProvider(app)
 app.secret_key = 'your-secret-key-here'
 
 SUBREDDITS_FILE = 'subreddits.json'
+MAX_BATCH_SIZE = 10  # Upper bound for /posts?count=
+MAX_STREAM_SIZE = 50  # Upper bound for /stream?count=
+STREAM_KEEPALIVE = 5  # Seconds between keepalive comments while a stream waits
+ASSET_MAX_AGE = 365 * 86400  # Fingerprinted static files never change under their URL
+COMPRESS_MIN_SIZE = 500  # Bytes; smaller bodies are not worth gzipping
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/javascript', 'application/javascript', 'application/json'}
+MEDIA_MAX_AGE = 30 * 86400  # /media/<key> is keyed on the original URL, so it never changes
+
+# MEDIA_PROXY=1 serves Reddit media through /media/<key> and a local disk cache
+media_cache = MediaCache() if os.environ.get('MEDIA_PROXY') == '1' else None
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL=DEBUG turns on the verbose per-post output
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
-# Create a global queue instance
-reddit_queue = RedditQueue(buffer_size=3)
+# FETCH_DAEMON=<socket path or host:port> reads posts from a shared fetch_daemon.py
+# process instead of fetching here, so several workers share one rate limit and cache
+FETCH_DAEMON = os.environ.get('FETCH_DAEMON')
+
+# One queue shared by every viewer, reloaded in place when the subreddits change.
+# The app never replaces it; queue_lock and get_queue() exist so that
+# benchmarks/bench_reddit.py can swap in a queue pointed at its fake server.
+if FETCH_DAEMON:
+    reddit_queue = RemoteQueue(FETCH_DAEMON, authkey=daemon_authkey())
+else:
+    reddit_queue = RedditQueue(buffer_size=3, fetcher=create_fetcher(), scheduler=create_scheduler())
+queue_lock = threading.Lock()
+
+def get_queue():
+    with queue_lock:
+        return reddit_queue
+
+def start_warm_up(queue):
+    """Fill the queue from the cache and start prefetching without blocking the caller"""
+    threading.Thread(target=queue.warm_up, name='reddit-warm-up', daemon=True).start()
+
+start_warm_up(reddit_queue)
+
+# Queue state sampled at scrape time, always from the current queue
+registry.gauge('reddit_ready_posts', 'Prefetched posts waiting to be published',
+               lambda: get_queue().get_progress()['ready_posts'])
+registry.gauge('reddit_feed_head', 'Posts published to the shared feed since the queue was created',
+               lambda: get_queue().feed_head)
+registry.gauge('reddit_unavailable_subreddits', 'Subreddits on a health cooldown',
+               lambda: get_queue().get_progress()['skipped_subreddits'])
+
+def viewer_cursor(queue):
+    """This viewer's position in the queue's feed, or None for a new viewer
+
+    Never past the head of the feed: /stream stores the end of its window
+    up front, so a stream that ended early leaves the session ahead.
+    """
+    if session.get('feed') != queue.generation:
+        return None
+    cursor = session.get('cursor')
+    return None if cursor is None else min(cursor, queue.feed_head)
+
+def set_viewer_cursor(queue, cursor):
+    session['feed'] = queue.generation
+    session['cursor'] = cursor
+
+def advance_viewer_cursor(queue, cursor):
+    """Move the viewer's cursor forward to cursor, never back"""
+    current = viewer_cursor(queue)
+    if current is None or cursor > current:
+        set_viewer_cursor(queue, cursor)
+
+@lru_cache(maxsize=64)
+def asset_digest(filename, mtime):
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with its content hash, so browsers can cache it for good"""
+    mtime = os.path.getmtime(os.path.join(app.static_folder, filename))
+    return url_for('static', filename=filename, v=asset_digest(filename, mtime))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    if request.endpoint not in (None, 'static', 'metrics'):
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, request.endpoint, str(response.status_code))
+    return response
+
+@app.after_request
+def cache_and_compress(response):
+    """Long-lived caching for fingerprinted assets, gzip for text responses"""
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code == 200:
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+
+    if (response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+
+    response.direct_passthrough = False  # send_file responses, so the body can be read
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    etag, _ = response.get_etag()
+    if etag:
+        # Same content in another encoding, still matches If-None-Match
+        response.set_etag(etag, weak=True)
+    return response
 
 def save_subreddits(subreddits_url):
     """Save subreddits to a JSON file"""
@@ -24,6 +148,11 @@ def save_subreddits(subreddits_url):
         'url': subreddits_url,
         'subreddits': subreddits
     }
+    # Keep the scheduler weights of subreddits that are still in the list
+    weights = (load_saved_data() or {}).get('weights') or {}
+    weights = {sub: weight for sub, weight in weights.items() if sub in subreddits}
+    if weights:
+        data['weights'] = weights
     with open(SUBREDDITS_FILE, 'w') as f:
         json.dump(data, f)
     return subreddits
@@ -38,18 +167,32 @@ def load_saved_data():
 @app.route('/')
 def index():
     saved_data = load_saved_data()
-    
-    # Initialize the buffer if it's empty
-    if not reddit_queue.get_current_posts():
-        reddit_queue.initialize_buffer()
-    
-    progress = reddit_queue.get_progress()
-    subreddits = reddit_queue.subreddits  # Ensure subreddits are passed to the template
+    queue = get_queue()
+
+    # Returning viewers pick up where they left off, new ones join at the head of the feed
+    cursor = viewer_cursor(queue)
+    if cursor is None:
+        cursor = queue.feed_head
+    start = max(0, cursor - queue.buffer_size)
+    # Only what is already published or ready; the page streams in the rest
+    start, posts = queue.window(start, queue.buffer_size, timeout=0)
+    set_viewer_cursor(queue, start + len(posts))
+
+    progress = queue.get_progress()
+    subreddits = queue.subreddits  # Ensure subreddits are passed to the template
     subreddit_counts = {sub: 1 for sub in subreddits}  # Placeholder counts
+    viewer_state = {
+        'posts': posts,
+        'currentPost': 0,
+        'feedId': queue.generation,
+        'feedCursor': start + len(posts),
+        'maxBatchSize': MAX_BATCH_SIZE,
+    }
     return render_template('index.html',
-                           posts=reddit_queue.get_current_posts(),
+                           posts=posts,
                            progress=progress,
                            currentPost=0,
+                           viewer_state=viewer_state,
                            subreddits=subreddits,
                            subreddit_counts=subreddit_counts,
                            saved_url=saved_data.get('url', '') if saved_data else '')
@@ -60,9 +203,10 @@ def update_subreddits():
     if subreddits_url:
         try:
             save_subreddits(subreddits_url)
-            reddit_queue.__init__(buffer_size=3)  # Reset the queue
-            reddit_queue.initialize_buffer()
-            flash('Subreddits updated successfully!', 'success')
+            # Applied to the running queue: viewers keep their place and posts of
+            # subreddits that stay are kept, new ones are fetched in the background
+            added, removed = get_queue().reload_subreddits()
+            flash(f'Subreddits updated successfully! {len(added)} added, {len(removed)} removed.', 'success')
             logger.info("Subreddits updated successfully.")
         except Exception as e:
             flash(f'Error saving subreddits: {str(e)}', 'error')
@@ -74,42 +218,26 @@ def update_subreddits():
 
 @app.route('/next_post', methods=['POST'])
 def next_post():
+    queue = get_queue()
     try:
         logger.debug("\n=== /next_post ROUTE START ===")
-        logger.debug(f"Current buffer state before fetch: {[p['subreddit'] for p in reddit_queue.get_current_posts()]}")
-        logger.debug(f"Current progress: {reddit_queue.get_progress()}")
-        
-        posts = reddit_queue.advance_queue()
-        progress = reddit_queue.get_progress()
-        
-        logger.debug(f"Buffer state after fetch: {[p['subreddit'] for p in posts]}")
-        logger.debug(f"New progress: {progress}")
-        
-        if posts and len(posts) > 0:
-            new_post = posts[-1]
-            post_data = {
-                'title': new_post.get('title', ''),
-                'url': new_post.get('url', ''),
-                'score': str(new_post.get('score', '0')),
-                'subreddit': new_post.get('subreddit', ''),
-                'media_url': new_post.get('media_url', ''),
-                'thumbnail': new_post.get('thumbnail', ''),
-                'author': new_post.get('author', ''),
-                'num_comments': new_post.get('num_comments', 0),
-                'selftext': new_post.get('selftext', ''),
-                'is_self': new_post.get('is_self', False),
-                'created_utc': new_post.get('created_utc', 0),
-                'domain': new_post.get('domain', ''),
-                'external_url': new_post.get('external_url', ''),
-                'post_hint': new_post.get('post_hint', ''),
-                'dash_url': new_post.get('dash_url'),
-                'is_video': new_post.get('is_video', False),
-            }
-            
-            logger.debug(f"Sending new post from r/{new_post['subreddit']}")
+        cursor = viewer_cursor(queue)
+        if cursor is None:
+            # Session from before a subreddit reload, continue at the head of the new feed
+            cursor = queue.feed_head
+        logger.debug(f"Viewer cursor {cursor}, feed head {queue.feed_head}")
+
+        seq, new_post = queue.post_at(cursor)
+        progress = queue.get_progress()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"New progress: {progress}")
+
+        if new_post:
+            set_viewer_cursor(queue, seq + 1)
+            logger.debug(f"Sending post {seq} from r/{new_post.subreddit}")
             return jsonify({
                 'success': True,
-                'posts': [post_data],
+                'posts': [new_post],
                 'progress': progress
             })
         else:
@@ -126,8 +254,153 @@ def next_post():
             'success': False,
             'error': str(e),
             'posts': [],
-            'progress': reddit_queue.get_progress()
+            'progress': queue.get_progress()
+        }), 500
+
+def feed_position(queue):
+    """Cursor from the query string, falling back to the viewer's session
+
+    Never past the head of the feed; post_at clamps as well, this keeps the
+    cursor handed back to the client and stored in the session honest.
+    """
+    cursor = request.args.get('cursor', type=int)
+    if cursor is None or request.args.get('feed', queue.generation) != queue.generation:
+        # No cursor, or one into a queue that was replaced by a subreddit reload
+        cursor = viewer_cursor(queue)
+    head = queue.feed_head
+    return head if cursor is None else max(0, min(cursor, head))
+
+def sse_event(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {app.json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/posts')
+def posts_batch():
+    """Up to count posts of the shared feed starting at cursor.
+
+    Waits for the first post like /next_post does, then adds whatever else
+    is already buffered. A window of the feed never changes once served, so
+    the response carries an ETag and repeated requests get a 304.
+    """
+    queue = get_queue()
+    count = max(1, min(request.args.get('count', 1, type=int), MAX_BATCH_SIZE))
+    cursor = feed_position(queue)
+
+    try:
+        seq, first = queue.post_at(cursor)
+        if first:
+            _, more = queue.window(seq + 1, count - 1, timeout=0)
+            posts = [first] + more
+        else:
+            posts = []
+    except Exception as e:
+        logger.error(f"Error in /posts route: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'posts': [],
+            'progress': queue.get_progress()
         }), 500
 
+    next_cursor = seq + len(posts)
+    advance_viewer_cursor(queue, next_cursor)
+    logger.debug(f"Sending posts {seq}..{next_cursor - 1} of feed {queue.generation}")
+
+    response = jsonify({
+        'success': bool(posts),
+        'error': None if posts else 'No more posts available',
+        'posts': posts,
+        'feed': queue.generation,
+        'cursor': seq,
+        'next_cursor': next_cursor,
+        'progress': queue.get_progress()
+    })
+    if posts:
+        # Weak, since the progress block may differ between identical windows
+        response.set_etag(f"{queue.generation}-{seq}-{len(posts)}", weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+    return response
+
+@app.route('/stream')
+def stream_posts():
+    """Server-Sent Events stream of up to count feed posts starting at cursor.
+
+    Each post is sent as a ``post`` event, with its feed position as the
+    event id, the moment the prefetcher makes it available. A ``done`` event
+    with the next cursor closes the stream once count posts were sent or
+    nothing arrived for ready_timeout seconds. The session cursor is moved to
+    the end of the stream up front, since cookies cannot be set mid-stream;
+    viewer_cursor clamps it to the feed head if the stream ends early.
+    """
+    queue = get_queue()
+    count = max(1, min(request.args.get('count', 1, type=int), MAX_STREAM_SIZE))
+    cursor = feed_position(queue)
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is not None:
+        cursor = last_event_id + 1  # EventSource reconnecting after a dropped connection
+    advance_viewer_cursor(queue, cursor + count)
+
+    def generate():
+        seq = cursor
+        sent = 0
+        idle_since = time.time()
+        error = None
+        try:
+            while sent < count:
+                found, post = queue.post_at(seq, timeout=STREAM_KEEPALIVE)
+                if post:
+                    yield sse_event('post', post, event_id=found)
+                    seq = found + 1
+                    sent += 1
+                    idle_since = time.time()
+                elif time.time() - idle_since >= queue.ready_timeout:
+                    error = 'No more posts available'
+                    break
+                else:
+                    yield ': keepalive\n\n'
+        except Exception as e:
+            logger.error(f"Error in /stream route: {e}", exc_info=True)
+            error = str(e)
+        logger.debug(f"Streamed {sent} posts from feed {queue.generation}, next cursor {seq}")
+        yield sse_event('done', {
+            'feed': queue.generation,
+            'next_cursor': seq,
+            'error': error,
+            'progress': queue.get_progress()
+        })
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/media/<key>')
+def media(key):
+    """Proxied Reddit media from the disk cache, with Range and conditional requests"""
+    if media_cache is None or len(key) != 32:
+        abort(404)
+    path = media_cache.fetch(key)
+    if not path:
+        url = media_cache.original_url(key)
+        if url:
+            # Could not cache it, let the browser load it from Reddit
+            return redirect(url)
+        abort(404)
+    # send_file answers Range requests and hands the file to the server's
+    # wsgi.file_wrapper, which uses sendfile() under gunicorn
+    return send_file(path, conditional=True, max_age=MEDIA_MAX_AGE)
+
+@app.route('/metrics')
+def metrics():
+    """Timing histograms and queue gauges in the Prometheus text format"""
+    if FETCH_DAEMON:
+        # Fetch timings are recorded in the daemon, this worker only has its own requests
+        text = registry.render(exclude=QUEUE_METRICS) + get_queue().metrics()
+    else:
+        text = registry.render()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
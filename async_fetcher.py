@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+
+try:
+    import httpx
+except ImportError:  # Optional dependency, only needed for the async client
+    httpx = None
+
+import health
+from metrics import FETCH_SECONDS, RATE_LIMIT_WAIT_SECONDS, FETCH_ERRORS
+from reddit import RedditFetcher, REDDIT_BASE_URL, USER_AGENT, conditional_headers
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRedditFetcher(RedditFetcher):
+    """RedditFetcher on top of an asyncio httpx client.
+
+    Requests run on a private event loop thread with one pooled, keep-alive
+    ``httpx.AsyncClient``, so many subreddits can be in flight at once without
+    a thread per request. RedditQueue sees ``is_async`` and schedules its
+    prefetches as ``get_post_async`` coroutines on that loop through
+    ``submit``. The synchronous ``get_post``/``fetch_page``/``get_listing``
+    contract is kept as a facade over the loop for everything else;
+    ``fetch_pages`` fetches many subreddits concurrently.
+    """
+
+    is_async = True
+
+    def __init__(self, rate_limiter=None, cache=None, seen=None, health=None, pool_size=20,
+                 keepalive_expiry=30, connect_timeout=3, read_timeout=5, media=None, base_url=REDDIT_BASE_URL):
+        if httpx is None:
+            raise RuntimeError("AsyncRedditFetcher requires httpx (pip install httpx)")
+        super().__init__(rate_limiter=rate_limiter, cache=cache, seen=seen, health=health,
+                         media=media, base_url=base_url)
+        self.session.close()  # The blocking session is not used by this fetcher
+
+        self.limits = httpx.Limits(max_connections=pool_size,
+                                   max_keepalive_connections=pool_size,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeouts = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._state_loaded = False
+        self._loop = asyncio.new_event_loop()
+        self._client = None
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='reddit-async-fetcher', daemon=True)
+        self._thread.start()
+        # Building the client loads the CA bundle, a noticeable stall; get it over with now
+        self._loop.call_soon_threadsafe(self._get_client)
+
+    def _run(self, coro):
+        """Run a coroutine on the fetcher's loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the fetcher's loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'},
+                limits=self.limits,
+                timeout=self.timeouts,
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def get_listing_async(self, path, label, subreddit=None, validators=None):
+        """Async counterpart of RedditFetcher.get_listing"""
+        client = self._get_client()
+        kind = 'page' if subreddit else 'batch'
+        headers = conditional_headers(validators)
+        for attempt in range(self.max_retries + 1):
+            RATE_LIMIT_WAIT_SECONDS.observe(await self.rate_limiter.acquire_async())
+            with FETCH_SECONDS.time(kind):
+                response = await client.get(f"/r/{path}", headers=headers)
+            self.rate_limiter.record_response(response.status_code, response.headers)
+
+            if response.status_code != 429:
+                break
+            logger.warning(f"Rate limit hit for {label} (attempt {attempt + 1}/{self.max_retries + 1})")
+        else:
+            FETCH_ERRORS.inc(kind)
+            return None
+
+        return self.read_listing(response, label, subreddit, validators)
+
+    async def fetch_page_async(self, subreddit, after=None):
+        return (await self.fetch_page_data_async(subreddit, after))[0]
+
+    async def fetch_page_data_async(self, subreddit, after=None):
+        try:
+            data = await self.get_listing_async(self.page_path(subreddit, after), f"r/{subreddit}", subreddit)
+            return self.store_page(subreddit, data, after), data
+        except Exception as e:
+            logger.error(f"Error in fetch_page for r/{subreddit}: {e}")
+            FETCH_ERRORS.inc('page')
+            self.health.record(subreddit, health.ERROR)
+            return None, None
+
+    async def get_post_async(self, subreddit):
+        """Async counterpart of RedditFetcher.get_post"""
+        if not self._state_loaded:
+            await asyncio.get_running_loop().run_in_executor(None, self._load_state)
+        post, fresh = self.pop_unseen(subreddit)
+        if post:
+            if not fresh:
+                self.refresh_in_background(subreddit)
+            logger.debug(f"Reservoir hit for r/{subreddit} (fresh={fresh})")
+            return post
+
+        after = self.cache.cursor(subreddit) if self.cache.is_fresh(subreddit) else None
+        for _ in range(self.page_budget):
+            posts, data = await self.fetch_page_data_async(subreddit, after=after)
+            more, after = self.next_page(posts, data, after)
+            if not more:
+                break
+        post, _ = self.pop_unseen(subreddit)
+        return post
+
+    def _load_state(self):
+        # The post cache and the seen index read their files on first use; do
+        # that on a worker thread, not on the loop
+        self.cache.stock(())
+        len(self.seen)
+        self._state_loaded = True
+
+    async def head(self, url):
+        """HEAD a media URL through the pooled client; None on a network error"""
+        try:
+            return await self._get_client().head(url, timeout=self.media.head_timeout)
+        except httpx.HTTPError as e:
+            logger.debug(f"HEAD {url} failed: {e}")
+            return None
+
+    async def preflight_async(self, post):
+        """MediaResolver.preflight without blocking the loop"""
+        return await self.media.preflight_async(post, self.head)
+
+    async def fetch_pages_async(self, subreddits):
+        pages = await asyncio.gather(*(self.fetch_page_async(s) for s in subreddits))
+        return dict(zip(subreddits, pages))
+
+    def get_listing(self, path, label, subreddit=None, validators=None):
+        return self._run(self.get_listing_async(path, label, subreddit, validators))
+
+    def fetch_pages(self, subreddits):
+        """Fetch the first page of every subreddit concurrently"""
+        return self._run(self.fetch_pages_async(list(subreddits)))
+
+    def close(self):
+        """Close the client and stop the event loop"""
+        if self._client is not None:
+            self._run(self._client.aclose())
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
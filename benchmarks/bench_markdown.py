@@ -0,0 +1,130 @@
+"""Benchmark the selftext renderer against the old per-call regex passes.
+
+Run from the repository root:
+
+    python benchmarks/bench_markdown.py [--repeat N] [--scale N]
+
+The corpus is every selftext in reddit_cache.json plus synthetic long posts
+that exercise lists, emphasis, links and code blocks. The legacy renderer is
+the pre-compiled-patterns implementation from RedditFetcher.extract_post_data,
+kept here as a baseline and as an output-equivalence check.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_renderer import render_markdown  # noqa: E402
+
+SAMPLE_PARAGRAPH = (
+    "# Weekly thread\n\n"
+    "Some **bold** text, some *italic* text and ***both***, plus ~~old~~ news.\n"
+    "1. first item with a [link](https://example.com/a)\n"
+    "2. second item\n"
+    "3. third item, see https://example.org/path?q=1\n\n"
+    "> quoted line\n"
+    "- bullet one\n"
+    "- bullet two\n\n"
+    "```\ncode block\n```\n"
+    "Inline `code`, a >!spoiler!< and x^2 math.\n\n"
+)
+
+
+def legacy_render(selftext):
+    """The renderer as it was inlined in extract_post_data"""
+    lines = selftext.split('\n')
+    in_list = False
+    processed_lines = []
+    current_list_number = 0
+    for line in lines:
+        line = line.strip()
+        list_match = re.match(r'^\s*(\d+)\.\s+(.+)$', line)
+        if list_match:
+            number = int(list_match.group(1))
+            if not in_list or number <= current_list_number:
+                if in_list:
+                    processed_lines.append('</ol>')
+                processed_lines.append('<ol>')
+                in_list = True
+            current_list_number = number
+            processed_lines.append(f'<li>{list_match.group(2)}</li>')
+        elif line != '' and in_list:
+            in_list = False
+            processed_lines.append('</ol>')
+            processed_lines.append(line)
+        else:
+            processed_lines.append(line)
+    if in_list:
+        processed_lines.append('</ol>')
+    selftext = '\n'.join(processed_lines)
+    selftext = re.sub(r'(?m)^# (.*?)$', r'<h1>\1</h1>', selftext)
+    selftext = re.sub(r'(?m)^## (.*?)$', r'<h2>\1</h2>', selftext)
+    selftext = re.sub(r'(?m)^### (.*?)$', r'<h3>\1</h3>', selftext)
+    selftext = re.sub(r'\*\*\*(.*?)\*\*\*', r'<strong><em>\1</em></strong>', selftext)
+    selftext = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', selftext)
+    selftext = re.sub(r'\*(.*?)\*', r'<em>\1</em>', selftext)
+    selftext = re.sub(r'~~(.*?)~~', r'<del>\1</del>', selftext)
+    selftext = re.sub(r'>!(.*?)!<', r'<span class="spoiler">\1</span>', selftext)
+    selftext = re.sub(r'(?m)^[*-] (.*?)$', r'<ul><li>\1</li></ul>', selftext)
+    selftext = re.sub(r'(?m)^> (.*?)$', r'<blockquote>\1</blockquote>', selftext)
+    selftext = re.sub(r'```(.*?)```', r'<pre><code>\1</code></pre>', selftext, flags=re.DOTALL)
+    selftext = re.sub(r'`(.*?)`', r'<code>\1</code>', selftext)
+    selftext = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)',
+                      r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', selftext)
+    selftext = re.sub(r'(?<!href=")(?<![\(\[])(https?://[^\s\)<>]+)',
+                      r'<a href="\1" target="_blank" rel="noopener noreferrer">\1</a>', selftext)
+    selftext = selftext.replace('\n\n', '<br><br>')
+    selftext = re.sub(r'\^(.*?)(?=\s|$)', r'<sup>\1</sup>', selftext)
+    return selftext
+
+
+def load_corpus(scale):
+    corpus = []
+    try:
+        with open('reddit_cache.json') as f:
+            data = json.load(f)
+        for entry in data.values():
+            posts = entry['posts'] if isinstance(entry, dict) else entry
+            corpus.extend(p['selftext'] for p in posts if isinstance(p, dict) and p.get('selftext'))
+    except (OSError, ValueError):
+        pass
+    # Long posts, each one distinct so memoization cannot hide the work
+    corpus.extend(f"Post {i}\n\n" + SAMPLE_PARAGRAPH * 40 for i in range(scale))
+    return corpus
+
+
+def bench(label, func, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    size = sum(map(len, corpus)) / 1e6
+    print(f"{label:<28} {best * 1000:9.2f} ms  {size / best:8.2f} MB/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scale', type=int, default=50, help='number of synthetic long posts')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.scale)
+    mismatches = sum(legacy_render(t) != render_markdown.__wrapped__(t) for t in corpus)
+    print(f"{len(corpus)} posts, {sum(map(len, corpus)) / 1e3:.0f} KB, {mismatches} output mismatches")
+
+    legacy = bench('legacy (re.sub per call)', legacy_render, corpus, args.repeat)
+    compiled = bench('render_markdown (uncached)', render_markdown.__wrapped__, corpus, args.repeat)
+    render_markdown.cache_clear()
+    memoized = bench('render_markdown (memoized)', render_markdown, corpus, args.repeat)
+    print(f"speedup: {legacy / compiled:.2f}x uncached, {legacy / memoized:.1f}x memoized")
+
+
+if __name__ == '__main__':
+    main()
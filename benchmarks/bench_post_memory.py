@@ -0,0 +1,80 @@
+"""Compare memory and serialization cost of Post objects against plain dicts.
+
+Run from the repository root:
+
+    python benchmarks/bench_post_memory.py [--count N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from post import Post, POST_FIELDS  # noqa: E402
+
+
+def sample_fields(i):
+    return {
+        'title': f'Post title number {i}',
+        'url': f'https://www.reddit.com/r/sample/comments/{i:x}/post_title/',
+        'score': str(i),
+        'subreddit': 'sample',
+        'media_url': '',
+        'gallery_images': [],
+        'thumbnail': 'self',
+        'author': f'user{i % 500}',
+        'num_comments': i % 300,
+        'selftext': 'Some **markdown** body',
+        'is_self': True,
+        'created_utc': 1733059585.0 + i,
+        'domain': 'self.sample',
+        'external_url': '',
+        'post_hint': '',
+        'is_video': False,
+        'dash_url': None,
+    }
+
+
+def measure(label, build, count):
+    # Field values are built outside the measurement so only the containers count
+    fields = [sample_fields(i) for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [build(f) for f in fields]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_item = (after - before) / count
+    print(f"{label:<32} {per_item:8.1f} bytes/post")
+    return items
+
+
+def time_serialize(label, items, serialize):
+    start = time.perf_counter()
+    for item in items:
+        serialize(item)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / len(items) * 1e6:8.2f} us/post")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{len(POST_FIELDS)} fields, {args.count} posts")
+    dicts = measure('dict (old extract_post_data)', dict, args.count)
+    posts = measure('Post (__slots__)', lambda f: Post(**f), args.count)
+
+    # The old /next_post copied every field into a second dict before jsonify
+    def old_route_copy(d):
+        return json.dumps({name: d.get(name, default) for name, default in POST_FIELDS.items()})
+
+    time_serialize('dict + per-field route copy', dicts, old_route_copy)
+    time_serialize('Post.to_json', posts, Post.to_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Offline benchmark of fetching, extraction, rendering and the Flask routes.
+
+Run from the repository root:
+
+    python benchmarks/bench_reddit.py [--latency 0.02] [--rate-429 0.02] [--requests 200]
+    python benchmarks/bench_reddit.py --json results.json
+    python benchmarks/bench_reddit.py --baseline results.json [--tolerance 0.25]
+
+Everything runs against benchmarks/fake_reddit.py on a local port, so no
+request leaves the machine. Reported:
+
+  fetch         posts/sec and requests/sec for per-subreddit pages, the
+                multireddit batch and, with httpx installed, the async client
+  prefetch      ms for a cold RedditQueue to publish one post from every
+                subreddit, with the blocking and (with httpx) the async
+                fetcher; the async one only pays off with --latency, at 0 the
+                in-process fake server competes with it for the GIL
+  refresh       subreddits/sec and bytes per subreddit when refreshing an
+                unchanged listing in full and through its watermark
+  routes        /next_post and /posts p50/p99 latency through the Flask app
+  parse         microseconds and peak bytes to parse a 100-post listing with
+                the json module (the old response.json() path), through
+                listing.parse_listing, and through its orjson-less fallback
+  extraction    microseconds per extract_post_data call
+  markdown      microseconds per render_markdown cache miss and hit
+  memory        bytes held per extracted, buffered Post
+
+With --baseline, every metric is compared against a previous --json run and
+the exit status is 1 if any got worse by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_reddit  # noqa: E402
+
+# Per-request INFO logs would dominate the output and the timings
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+# Metric name suffix -> whether a higher value is better
+HIGHER_IS_BETTER = {'per_sec': True, '_ms': False, '_us': False, '_bytes': False}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def make_fetcher(base_url, fetcher_class=None, rate=1000):
+    """A fetcher with private, in-memory state and no media HEAD checks"""
+    from cache import PostCache
+    from health import SubredditHealth
+    from media import MediaResolver
+    from ratelimit import RateLimiter
+    from reddit import RedditFetcher
+    from seen import SeenIndex
+
+    class OfflineMediaResolver(MediaResolver):
+        def check(self, url):
+            return True  # Media lives on Reddit's CDNs, not on the fake server
+
+        async def check_async(self, url, head):
+            return True
+
+    fetcher_class = fetcher_class or RedditFetcher
+    return fetcher_class(rate_limiter=RateLimiter(rate=rate, capacity=rate, max_rate=rate),
+                         cache=PostCache(path=None), seen=SeenIndex(path=None), health=SubredditHealth(),
+                         media=OfflineMediaResolver(), base_url=base_url)
+
+
+def bench_fetch(fake, base_url, rounds, results):
+    from reddit import RedditFetcher
+    clients = [('sync', RedditFetcher)]
+    try:
+        from async_fetcher import AsyncRedditFetcher, httpx
+        if httpx is not None:
+            clients.append(('async', AsyncRedditFetcher))
+    except ImportError:
+        pass
+
+    subreddits = fake.subreddits
+    for label, fetcher_class in clients:
+        fetcher = make_fetcher(base_url, fetcher_class)
+        # Connection and client setup is a one-off cost, keep it out of the timings
+        fetcher.get_listing(f"{subreddits[0]}/hot.json?limit=1", 'connection warm-up')
+        requests_before = fake.requests
+        posts = 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fetcher.seen.clear()
+            pages = fetcher.fetch_pages(subreddits)
+            posts += sum(len(p) for p in pages.values() if p)
+        elapsed = time.perf_counter() - start
+        results[f'fetch_{label}_posts_per_sec'] = posts / elapsed
+        results[f'fetch_{label}_requests_per_sec'] = (fake.requests - requests_before) / elapsed
+        if hasattr(fetcher, 'close'):
+            fetcher.close()
+
+    fetcher = make_fetcher(base_url)
+    posts = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fetcher.seen.clear()
+        posts += sum(len(p) for p in fetcher.fetch_batch(subreddits).values())
+    results['fetch_batch_posts_per_sec'] = posts / (time.perf_counter() - start)
+
+
+def bench_prefetch(fake, base_url, results):
+    from reddit import RedditFetcher, RedditQueue
+    from scheduler import RoundRobinScheduler
+    clients = [('sync', RedditFetcher)]
+    try:
+        from async_fetcher import AsyncRedditFetcher, httpx
+        if httpx is not None:
+            clients.append(('async', AsyncRedditFetcher))
+    except ImportError:
+        pass
+
+    for label, fetcher_class in clients:
+        fetcher = make_fetcher(base_url, fetcher_class)
+        fetcher.get_listing(f"{fake.subreddits[0]}/hot.json?limit=1", 'connection warm-up')
+        queue = RedditQueue(fetcher=fetcher, scheduler=RoundRobinScheduler())
+        queue.subreddits = list(fake.subreddits)
+        queue.positions = {subreddit: index for index, subreddit in enumerate(queue.subreddits)}
+        queue._batch_due = False  # Every post needs a page fetch, no multireddit shortcut
+        start = time.perf_counter()
+        queue.window(0, len(queue.subreddits))
+        results[f'prefetch_{label}_fill_ms'] = (time.perf_counter() - start) * 1000
+        queue.stop_prefetch()
+        queue._prefetch_thread.join()  # It may be warming the cache through the fetcher
+        if hasattr(fetcher, 'close'):
+            fetcher.close()
+
+
+def bench_refresh(fake, base_url, rounds, results):
+    subreddits = fake.subreddits
+    for label, refresh in (('full', lambda fetcher, s: fetcher.fetch_page(s)),
+                           ('incremental', lambda fetcher, s: fetcher.refresh_page(s))):
+        fetcher = make_fetcher(base_url)
+        fetcher.fetch_pages(subreddits)
+        bytes_before = fake.bytes_sent
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for subreddit in subreddits:
+                refresh(fetcher, subreddit)
+        elapsed = time.perf_counter() - start
+        refreshes = rounds * len(subreddits)
+        results[f'refresh_{label}_per_sec'] = refreshes / elapsed
+        results[f'refresh_{label}_bytes'] = (fake.bytes_sent - bytes_before) / refreshes
+
+
+def bench_routes(fake, base_url, count, results):
+    # The app keeps its cache, seen index and subreddits file in the working directory
+    workdir = tempfile.mkdtemp(prefix='bench-reddit-')
+    os.chdir(workdir)
+    with open('subreddits.json', 'w') as f:
+        json.dump({'url': '', 'subreddits': fake.subreddits}, f)
+    os.environ['REDDIT_BASE_URL'] = base_url
+
+    import app as app_module
+    from reddit import RedditQueue
+
+    queue = RedditQueue(buffer_size=3, fetcher=make_fetcher(base_url))
+    with app_module.queue_lock:
+        old_queue, app_module.reddit_queue = app_module.reddit_queue, queue
+    old_queue.stop_prefetch()
+    queue.warm_up()
+
+    client = app_module.app.test_client()
+    client.get('/')
+
+    for label, send in (('next_post', lambda: client.post('/next_post')),
+                        ('posts', lambda: client.get('/posts?count=5'))):
+        timings = []
+        failures = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            response = send()
+            timings.append((time.perf_counter() - start) * 1000)
+            if not response.get_json().get('success'):
+                failures += 1
+        results[f'route_{label}_p50_ms'] = percentile(timings, 50)
+        results[f'route_{label}_p99_ms'] = percentile(timings, 99)
+        if failures:
+            print(f"  {label}: {failures}/{count} requests found no post", file=sys.stderr)
+    queue.stop_prefetch()
+
+
+def bench_parse(fake, results, repeat=20):
+    import listing
+
+    children, _ = fake.page(fake.subreddits, 100, None)
+    body = json.dumps({'kind': 'Listing', 'data': {'after': None, 'children': children}}).encode()
+    parsers = [('full', json.loads), ('projected', listing.parse_listing)]
+    if listing.orjson is not None:
+        parsers.append(('streaming', lambda content: streaming_parse(listing, content)))
+
+    for label, parse in parsers:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse(body)
+        results[f'parse_{label}_us'] = (time.perf_counter() - start) / repeat * 1e6
+        tracemalloc.start()
+        parsed = parse(body)
+        results[f'parse_{label}_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del parsed
+
+
+def streaming_parse(listing, content):
+    """parse_listing as it runs without orjson installed"""
+    orjson, listing.orjson = listing.orjson, None
+    try:
+        return listing.parse_listing(content)
+    finally:
+        listing.orjson = orjson
+
+
+def bench_extraction(fake, results):
+    from markdown_renderer import render_markdown
+
+    fetcher = make_fetcher(fake.url)
+    children = [c['data'] for _, listing in fake.listings.values() for c in listing]
+    subreddit = 'bench'
+
+    start = time.perf_counter()
+    for data in children:
+        fetcher.extract_post_data(data, subreddit)
+    results['extract_per_post_us'] = (time.perf_counter() - start) / len(children) * 1e6
+
+    texts = list({data['selftext'] for data in children if data['selftext']})
+    if texts:
+        render_markdown.cache_clear()
+        start = time.perf_counter()
+        for text in texts:
+            render_markdown(text)
+        results['markdown_miss_us'] = (time.perf_counter() - start) / len(texts) * 1e6
+        start = time.perf_counter()
+        for text in texts:
+            render_markdown(text)
+        results['markdown_hit_us'] = (time.perf_counter() - start) / len(texts) * 1e6
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    buffered = [fetcher.extract_post_data(data, subreddit) for data in children]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    results['memory_per_post_bytes'] = (after - before) / len(buffered)
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline run; True if nothing regressed"""
+    ok = True
+    for name, value in results.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        higher_is_better = next((v for suffix, v in HIGHER_IS_BETTER.items() if name.endswith(suffix)), False)
+        change = (value - baseline[name]) / baseline[name]
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        ok = ok and not regressed
+        print(f"  {name:<36} {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    fake_reddit.add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=3, help='passes over every subreddit in the fetch benchmark')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route in the route benchmark')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results written earlier with --json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    fake = fake_reddit.from_arguments(args)
+    base_url = fake.start()
+    print(f"Fake Reddit at {base_url}: {len(fake.subreddits)} subreddits, {args.posts_per_sub} posts each, "
+          f"latency {args.latency}s, {args.rate_429:.0%} 429s")
+
+    results = {}
+    try:
+        bench_parse(fake, results)
+        bench_extraction(fake, results)
+        bench_fetch(fake, base_url, args.rounds, results)
+        bench_prefetch(fake, base_url, results)
+        bench_refresh(fake, base_url, args.rounds, results)
+        bench_routes(fake, base_url, args.requests, results)
+    finally:
+        fake.stop()
+
+    for name, value in results.items():
+        print(f"{name:<38} {value:12.2f}")
+    print(f"{fake.requests} fake Reddit requests, {fake.throttled} answered with 429, "
+          f"{fake.not_modified} with 304")
+
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        path = os.path.join(ROOT, args.baseline) if not os.path.isabs(args.baseline) else args.baseline
+        with open(path) as f:
+            baseline = json.load(f)
+        print(f"Against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
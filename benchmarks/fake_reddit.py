@@ -0,0 +1,334 @@
+"""A local stand-in for Reddit's listing JSON, for offline benchmarks.
+
+Run from the repository root:
+
+    python benchmarks/fake_reddit.py [--port 8001] [--latency 0.05] [--rate-429 0.05]
+
+then start the app against it with REDDIT_BASE_URL=http://127.0.0.1:8001.
+
+Listings are seeded from reddit_cache.json (either the current layout or the
+legacy subreddit -> [post, timestamp] one). Each subreddit serves
+--posts-per-sub posts, cycling through its seed posts under fresh ids, in
+pages that honour limit=, after= and before=. Responses carry an ETag and
+answer a matching If-None-Match with 304. Multireddits (/r/a+b/hot.json) are
+interleaved by created_utc like Reddit does. Children carry the hundred-odd
+fields, preview renditions and award blobs real listings do, so parsing
+costs what it costs against Reddit. The server can add latency,
+answer a share of requests with 429 and Retry-After, put stickied posts on
+the first page and send X-Ratelimit-* headers. Unknown subreddits get a 404.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+LISTING_PATH = re.compile(r'^/r/([^/]+)/hot\.json$')
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'reddit_cache.json')
+
+
+def load_seed_posts(path):
+    """subreddit -> cached post dicts, from either reddit_cache.json layout"""
+    with open(path) as f:
+        data = json.load(f)
+    seeds = {}
+    for subreddit, entry in data.items():
+        posts = entry.get('posts', []) if isinstance(entry, dict) else entry
+        posts = [p for p in posts if isinstance(p, dict)]
+        if posts:
+            seeds[subreddit] = posts
+    return seeds
+
+
+def listing_child(seed, subreddit, n, stickied=False, shift=0):
+    """Rebuild a raw listing child from a cached post dict, shift seconds later"""
+    post_id = f"{subreddit.lower()}{n}"
+    url = seed.get('url', '')
+    permalink = url.replace('https://www.reddit.com', '') or f"/r/{subreddit}/comments/{post_id}/"
+    data = {
+        'id': post_id,
+        'name': f"t3_{post_id}",
+        'title': seed.get('title', ''),
+        'permalink': permalink,
+        'url': seed.get('external_url') or url,
+        'score': int(seed.get('score') or 0),
+        'subreddit': subreddit,
+        'thumbnail': seed.get('thumbnail', ''),
+        'author': seed.get('author', '[deleted]'),
+        'num_comments': seed.get('num_comments', 0),
+        'selftext': seed.get('selftext', ''),
+        'is_self': seed.get('is_self', not seed.get('external_url')),
+        'created_utc': float(seed.get('created_utc') or 0) + shift - n * 60,
+        'domain': seed.get('domain', f"self.{subreddit}"),
+        'post_hint': seed.get('post_hint', ''),
+        'is_video': seed.get('is_video', False),
+        'stickied': stickied,
+    }
+    if data['is_video'] and seed.get('media_url'):
+        data['media'] = {'reddit_video': {'fallback_url': seed['media_url'], 'dash_url': seed.get('dash_url'),
+                                          'width': 1280, 'height': 720}}
+    data.update(reddit_extras(data, n))
+    image = data['url'] if data['url'].lower().split('?')[0].endswith(('.jpg', '.jpeg', '.png', '.gif')) else ''
+    if image:
+        data['preview'] = {'enabled': True, 'images': [{
+            'id': post_id,
+            'source': {'url': image, 'width': 3024, 'height': 4032},
+            'resolutions': [{'url': f"{image}?width={w}&amp;crop=smart&amp;auto=webp&amp;s={post_id}",
+                             'width': w, 'height': w * 4 // 3} for w in (108, 216, 320, 640, 960, 1080)],
+            'variants': {},
+        }]}
+    if seed.get('gallery_images'):
+        data['is_gallery'] = True
+        data['media_metadata'] = {
+            f"m{i}": {'status': 'valid', 'e': 'Image', 's': {'u': image, 'x': 1080, 'y': 1080}}
+            for i, image in enumerate(seed['gallery_images'])
+        }
+    return {'kind': 't3', 'data': data}
+
+
+AWARD = {
+    'giver_coin_reward': None, 'subreddit_id': None, 'is_new': False, 'days_of_drip_extension': None,
+    'coin_price': 150, 'id': 'award_f44611f1-b89e-46dc-97fe-892280b13b82', 'penny_donate': None,
+    'award_sub_type': 'GLOBAL', 'coin_reward': 0, 'icon_url': 'https://i.redd.it/award_images/t5_22cerq/klvxk1wggfd41_Helpful.png',
+    'days_of_premium': None, 'tiers_by_required_awardings': None,
+    'resized_icons': [{'url': f'https://preview.redd.it/award_images/t5_22cerq/klvxk1wggfd41_Helpful.png?width={w}'
+                              f'&amp;height={w}&amp;auto=webp&amp;s=3a5f2b9f5e1b', 'width': w, 'height': w}
+                      for w in (16, 32, 48, 64, 128)],
+    'icon_width': 2048, 'static_icon_width': 2048, 'start_date': None, 'is_enabled': True,
+    'awardings_required_to_grant_benefits': None, 'description': 'Thank you stranger. Shows the award.',
+    'end_date': None, 'sticky_duration_seconds': None, 'subreddit_coin_reward': 0, 'count': 1,
+    'static_icon_height': 2048, 'name': 'Helpful', 'icon_format': None, 'icon_height': 2048,
+    'penny_price': None, 'award_type': 'global',
+    'static_icon_url': 'https://i.redd.it/award_images/t5_22cerq/klvxk1wggfd41_Helpful.png',
+}
+
+
+def reddit_extras(data, n):
+    """The fields a real listing child has on top of the ones the app reads"""
+    return {
+        'approved_at_utc': None, 'subreddit_id': 't5_2qh1i', 'selftext_html': (
+            f"<!-- SC_OFF --><div class=\"md\"><p>{data['selftext']}</p>\n</div><!-- SC_ON -->"
+            if data['selftext'] else None),
+        'saved': False, 'mod_reason_title': None, 'gilded': 0, 'clicked': False, 'link_flair_richtext': [
+            {'e': 'text', 't': 'Discussion'}], 'subreddit_name_prefixed': f"r/{data['subreddit']}",
+        'hidden': False, 'pwls': 6, 'link_flair_css_class': 'discussion', 'downs': 0,
+        'thumbnail_height': 140, 'top_awarded_type': None, 'hide_score': False, 'quarantine': False,
+        'link_flair_text_color': 'dark', 'upvote_ratio': 0.97, 'author_flair_background_color': None,
+        'subreddit_type': 'public', 'ups': data['score'], 'total_awards_received': 1 if n % 3 == 0 else 0,
+        'media_embed': {}, 'thumbnail_width': 140, 'author_flair_template_id': None,
+        'is_original_content': False, 'user_reports': [], 'secure_media': data.get('media'),
+        'is_reddit_media_domain': data['domain'] in ('i.redd.it', 'v.redd.it'), 'is_meta': False,
+        'category': None, 'secure_media_embed': {}, 'link_flair_text': 'Discussion', 'can_mod_post': False,
+        'approved_by': None, 'is_created_from_ads_ui': False, 'author_premium': False, 'edited': False,
+        'author_flair_css_class': None, 'author_flair_richtext': [], 'gildings': {},
+        'content_categories': None, 'mod_note': None, 'created': data['created_utc'],
+        'link_flair_type': 'richtext', 'wls': 6, 'removed_by_category': None, 'banned_by': None,
+        'author_flair_type': 'text', 'allow_live_comments': False, 'likes': None, 'suggested_sort': None,
+        'banned_at_utc': None, 'view_count': None, 'archived': False, 'no_follow': False,
+        'is_crosspostable': True, 'pinned': False, 'over_18': False,
+        'all_awardings': [AWARD] if n % 3 == 0 else [], 'awarders': [], 'media_only': False,
+        'link_flair_template_id': '5e3f0a2c-8d4b-11ea-9d7e-0e5a2f6b3c11', 'can_gild': False,
+        'spoiler': False, 'locked': False, 'author_flair_text': None, 'treatment_tags': [],
+        'visited': False, 'removed_by': None, 'num_reports': None, 'distinguished': None,
+        'author_is_blocked': False, 'mod_reason_by': None, 'removal_reason': None,
+        'link_flair_background_color': '#ffd635', 'is_robot_indexable': True, 'report_reasons': None,
+        'discussion_type': None, 'send_replies': True, 'contest_mode': False, 'mod_reports': [],
+        'author_patreon_flair': False, 'author_flair_text_color': None, 'author_fullname': 't2_8f3kz1pq',
+        'parent_whitelist_status': 'all_ads', 'whitelist_status': 'all_ads',
+        'subreddit_subscribers': 1843210, 'num_crossposts': 0, 'is_video': data['is_video'],
+    }
+
+
+class FakeReddit:
+    def __init__(self, seeds, posts_per_sub=100, latency=0.0, jitter=0.0, rate_429=0.0,
+                 retry_after=1, stickied=2, ratelimit_budget=None, seed=0):
+        self.posts_per_sub = posts_per_sub
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stickied = stickied
+        self.ratelimit_budget = ratelimit_budget  # X-Ratelimit-Remaining per 600s window, None to omit
+        self.random = random.Random(seed)
+        self.listings = {}
+        # Move the seed posts' timestamps up so the newest one is from just now
+        newest = max(float(p.get('created_utc') or 0) for posts in seeds.values() for p in posts)
+        shift = time.time() - newest if newest else 0
+        for subreddit, posts in seeds.items():
+            children = [listing_child(posts[n % len(posts)], subreddit, n, shift=shift)
+                        for n in range(posts_per_sub)]
+            pinned = [listing_child(posts[n % len(posts)], subreddit, posts_per_sub + n, stickied=True, shift=shift)
+                      for n in range(stickied)]
+            self.listings[subreddit.lower()] = (pinned, children)
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.window_start = time.time()
+        self.used = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def subreddits(self):
+        return list(self.listings)
+
+    def page(self, subreddits, limit, after, before=None):
+        """(children, next after) for one listing request, or None for unknown subreddits"""
+        pinned, children = [], []
+        for subreddit in subreddits:
+            listing = self.listings.get(subreddit.lower())
+            if listing is None:
+                return None
+            pinned.extend(listing[0])
+            children.extend(listing[1])
+        if len(subreddits) > 1:
+            children.sort(key=lambda c: -c['data']['created_utc'])
+
+        names = [c['data']['name'] for c in children]
+        if before:
+            # The posts ranked just above before=; nothing if it left the listing
+            end = names.index(before) if before in names else 0
+            return children[max(0, end - limit):end], None
+
+        start = 0
+        if after:
+            start = names.index(after) + 1 if after in names else len(children)
+        page = children[start:start + limit]
+        next_after = page[-1]['data']['name'] if start + limit < len(children) and page else None
+        # Like Reddit, stickied posts only lead the first page of a single subreddit
+        if not after and len(subreddits) == 1:
+            page = pinned + page
+        return page, next_after
+
+    def handle(self, path, query):
+        """(status, headers, body) for one request"""
+        with self._lock:
+            self.requests += 1
+            if time.time() - self.window_start >= 600:
+                self.window_start, self.used = time.time(), 0
+            self.used += 1
+            throttle = self.random.random() < self.rate_429
+            if throttle:
+                self.throttled += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        if self.ratelimit_budget is not None:
+            headers['X-Ratelimit-Used'] = str(self.used)
+            headers['X-Ratelimit-Remaining'] = str(max(0, self.ratelimit_budget - self.used))
+            headers['X-Ratelimit-Reset'] = str(int(600 - (time.time() - self.window_start)))
+        if throttle:
+            headers['Retry-After'] = str(self.retry_after)
+            return 429, headers, {'message': 'Too Many Requests', 'error': 429}
+
+        match = LISTING_PATH.match(path)
+        if not match:
+            return 404, headers, {'message': 'Not Found', 'error': 404}
+        params = parse_qs(query)
+        limit = min(int(params.get('limit', ['25'])[0]), 100)
+        result = self.page(match.group(1).split('+'), limit, params.get('after', [None])[0],
+                           params.get('before', [None])[0])
+        if result is None:
+            return 404, headers, {'message': 'Not Found', 'error': 404}
+        children, next_after = result
+        return 200, headers, {'kind': 'Listing', 'data': {'after': next_after, 'dist': len(children),
+                                                          'children': children}}
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve in a background thread; returns the base URL"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real thing
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, headers, body = fake.handle(parts.path, parts.query)
+                payload = json.dumps(body).encode()
+                if status == 200:
+                    headers['ETag'] = f'"{hashlib.sha1(payload).hexdigest()[:16]}"'
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status, payload = 304, b''
+                with fake._lock:
+                    fake.bytes_sent += len(payload)
+                    fake.not_modified += status == 304
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-reddit', daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def add_arguments(parser):
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='reddit_cache.json-style seed file')
+    parser.add_argument('--posts-per-sub', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--stickied', type=int, default=2, help='stickied posts on each first page')
+    parser.add_argument('--ratelimit-budget', type=int, default=None,
+                        help='send X-Ratelimit-* headers for this many requests per 10 minutes')
+
+
+def from_arguments(args):
+    return FakeReddit(load_seed_posts(args.fixture), posts_per_sub=args.posts_per_sub, latency=args.latency,
+                      jitter=args.jitter, rate_429=args.rate_429, stickied=args.stickied,
+                      ratelimit_budget=args.ratelimit_budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args)
+    url = fake.start(args.host, args.port)
+    print(f"Serving {len(fake.subreddits)} subreddits at {url}: {'+'.join(fake.subreddits)}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+        print(f"{fake.requests} requests, {fake.throttled} throttled", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import atexit
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from post import Post
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'reddit_cache.json'
+
+
+class PostCache:
+    """Per-subreddit post reservoir persisted to reddit_cache.json.
+
+    Each entry holds the unseen posts of a subreddit, the listing's ``after``
+    cursor for the next page, a watermark (fullname and ``created_utc`` of
+    the listing's top post, when it was recorded, and the response
+    validators of the last refresh) and when it was fetched, so callers can tell fresh data from
+    stale data; stale entries are still returned so the UI can show
+    something while a refresh runs. Entries are kept in LRU order and
+    bounded by ``max_subreddits`` and ``max_posts``. Changes are written by a
+    background thread at most every ``save_interval`` seconds, so callers
+    (among them the async fetcher's event loop) never wait on the disk, and
+    once more at exit. Writes go through a temp file and ``os.replace`` so a
+    crash never leaves a half-written cache behind. With ``path=None`` the
+    cache lives in memory only.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=600, ttl_overrides=None,
+                 max_subreddits=500, max_posts=100, save_interval=5):
+        self.path = path
+        self.ttl = ttl
+        self.ttl_overrides = dict(ttl_overrides or {})
+        self.max_subreddits = max_subreddits
+        self.max_posts = max_posts
+        self.save_interval = save_interval
+        self.entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # One save at a time, so an older snapshot never lands last
+        self._loaded = False
+        self._dirty = False
+        self._last_save = 0.0
+        self._save_wanted = threading.Event()
+        self._writer = None
+        atexit.register(self.flush)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        """Warm-start from disk; accepts the legacy subreddit -> [posts] layout"""
+        with self._lock:
+            self._loaded = True
+            if not self.path:
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                mtime = os.path.getmtime(self.path)
+            except FileNotFoundError:
+                return
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Error loading cache file {self.path}: {e}")
+                return
+
+            for subreddit, entry in data.items():
+                if isinstance(entry, list):
+                    entry = _legacy_entry(entry, mtime)
+                if not isinstance(entry, dict) or not isinstance(entry.get('posts'), list):
+                    continue
+                self.entries[subreddit] = {
+                    'fetched_at': float(entry.get('fetched_at', mtime)),
+                    'posts': [Post.from_dict(p) for p in entry['posts'][:self.max_posts]],
+                    'after': entry.get('after'),
+                    'watermark': entry.get('watermark'),
+                }
+            self._evict()
+            logger.info(f"Loaded {len(self.entries)} cached subreddits from {self.path}")
+
+    def ttl_for(self, subreddit):
+        return self.ttl_overrides.get(subreddit, self.ttl)
+
+    def is_fresh(self, subreddit):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            return bool(entry) and time.time() - entry['fetched_at'] < self.ttl_for(subreddit)
+
+    def get(self, subreddit):
+        """Return (posts, fresh); posts is None when nothing is cached"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            if not entry or not entry['posts']:
+                return None, False
+            self.entries.move_to_end(subreddit)
+            fresh = time.time() - entry['fetched_at'] < self.ttl_for(subreddit)
+            return entry['posts'], fresh
+
+    def pop(self, subreddit):
+        """Take the next unseen post; returns (post, fresh) or (None, False)"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            if not entry or not entry['posts']:
+                return None, False
+            self.entries.move_to_end(subreddit)
+            fresh = time.time() - entry['fetched_at'] < self.ttl_for(subreddit)
+            post = entry['posts'].pop(0)
+            self._dirty = True
+        self.maybe_save()
+        return post, fresh
+
+    def stock(self, subreddits):
+        """subreddit -> (posts left, fresh) for those with cached posts; LRU order is untouched"""
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            stock = {}
+            for subreddit in subreddits:
+                entry = self.entries.get(subreddit)
+                if entry and entry['posts']:
+                    stock[subreddit] = (len(entry['posts']), now - entry['fetched_at'] < self.ttl_for(subreddit))
+            return stock
+
+    def cursor(self, subreddit):
+        """The ``after`` fullname to continue the subreddit's listing from"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            return entry.get('after') if entry else None
+
+    def watermark(self, subreddit):
+        """The subreddit's watermark dict, or None"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            return dict(entry['watermark']) if entry and entry.get('watermark') else None
+
+    def put(self, subreddit, posts, after=None, append=False, watermark=None):
+        """Store a page of posts, replacing the reservoir unless append is set
+
+        A replaced entry takes the new watermark; an appended page keeps the old one.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit) if append else None
+            if entry:
+                known = {p.url for p in entry['posts']}
+                entry['posts'].extend(p for p in posts if p.url not in known)
+                del entry['posts'][self.max_posts:]
+                entry['after'] = after
+                entry['fetched_at'] = time.time()
+            else:
+                self.entries[subreddit] = {
+                    'fetched_at': time.time(),
+                    'posts': list(posts)[:self.max_posts],
+                    'after': after,
+                    'watermark': watermark,
+                }
+            self.entries.move_to_end(subreddit)
+            self._evict()
+            self._dirty = True
+        self.maybe_save()
+
+    def merge_new(self, subreddit, posts, watermark, after=None):
+        """Put posts newer than the reservoir in front of it and mark the entry fresh
+
+        ``after`` is only used for a new entry; an existing one keeps its cursor.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.entries.get(subreddit)
+            if not entry:
+                entry = self.entries[subreddit] = {'posts': [], 'after': after}
+            known = {p.key for p in entry['posts']}
+            entry['posts'][:0] = [p for p in posts if p.key not in known]
+            del entry['posts'][self.max_posts:]
+            entry['watermark'] = watermark
+            entry['fetched_at'] = time.time()
+            self.entries.move_to_end(subreddit)
+            self._evict()
+            self._dirty = True
+        self.maybe_save()
+
+    def discard(self, subreddit):
+        with self._lock:
+            self._ensure_loaded()
+            if self.entries.pop(subreddit, None) is not None:
+                self._dirty = True
+
+    def _evict(self):
+        while len(self.entries) > self.max_subreddits:
+            subreddit, _ = self.entries.popitem(last=False)
+            logger.debug(f"Evicted r/{subreddit} from post cache")
+
+    def maybe_save(self):
+        """Have the writer thread save the changes, once save_interval has passed since the last save"""
+        if self.path and self._dirty:
+            if self._writer is None:
+                with self._lock:
+                    if self._writer is None:
+                        self._writer = threading.Thread(target=self._write_loop, name='post-cache-writer',
+                                                        daemon=True)
+                        self._writer.start()
+            self._save_wanted.set()
+
+    def _write_loop(self):
+        while True:
+            self._save_wanted.wait()
+            delay = self._last_save + self.save_interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._save_wanted.clear()
+            if self._dirty:
+                self.save()
+
+    def flush(self):
+        if self.path and self._dirty:
+            self.save()
+
+    def save(self):
+        """Atomically write the cache to disk
+
+        Saves are serialized from the snapshot to the replace, so an older
+        snapshot never lands after a newer one.
+        """
+        with self._save_lock:
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            data = {sub: dict(entry, posts=[p.to_cache_dict() for p in entry['posts']])
+                    for sub, entry in self.entries.items()}
+            self._dirty = False
+            self._last_save = time.time()
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.reddit_cache.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # mkstemp creates the file 0600, keep the mode the cache file had
+                os.chmod(tmp_path, _file_mode(self.path))
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.error(f"Error saving cache file {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+
+
+def _file_mode(path, default=0o644):
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return default
+
+
+def _legacy_entry(items, mtime):
+    """Convert the old [post, ..., iso-timestamp] list into an entry dict"""
+    fetched_at = mtime
+    posts = []
+    for item in items:
+        if isinstance(item, dict):
+            posts.append(item)
+        elif isinstance(item, str):
+            try:
+                fetched_at = datetime.fromisoformat(item).timestamp()
+            except ValueError:
+                pass
+    return {'fetched_at': fetched_at, 'posts': posts}
+
+
+# One cache for the whole process, loaded from disk on first use
+shared_cache = PostCache()
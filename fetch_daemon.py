@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+from reddit import RedditQueue, create_fetcher, create_scheduler
+from metrics import registry, QUEUE_METRICS
+
+logger = logging.getLogger(__name__)
+
+DAEMON_ADDRESS = 'fetch_daemon.sock'
+
+# What a RemoteQueue may read and call on the daemon's queue
+QUEUE_ATTRIBUTES = {'generation', 'feed_head', 'buffer_size', 'ready_timeout', 'subreddits'}
+QUEUE_METHODS = {'post_at', 'window', 'get_progress', 'get_current_posts', 'reload_subreddits'}
+
+
+def parse_address(address):
+    """'host:port' is a TCP address, anything else the path of a Unix socket"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+def daemon_authkey():
+    key = os.environ.get('FETCH_DAEMON_KEY')
+    return key.encode() if key else None
+
+
+class FetchDaemon:
+    """Owns the RedditQueue when the app runs as several worker processes.
+
+    One daemon does all the fetching, rate limiting, caching and seen-post
+    bookkeeping, so adding web workers adds no requests to Reddit. Workers
+    reach it through RemoteQueue over an owner-only Unix socket, or over TCP
+    when FETCH_DAEMON_KEY is set, using multiprocessing.connection. Every
+    connection gets its own thread, so a viewer waiting on post_at does not
+    hold up the others.
+    """
+
+    def __init__(self, address=DAEMON_ADDRESS, authkey=None, buffer_size=3):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        if not isinstance(self.address, str) and not authkey:
+            # Requests are pickles, anyone who can connect could run code in the daemon
+            raise ValueError("A TCP fetch daemon needs FETCH_DAEMON_KEY; use a Unix socket otherwise")
+        self.queue = RedditQueue(buffer_size=buffer_size, fetcher=create_fetcher(), scheduler=create_scheduler())
+
+    def dispatch(self, op, name=None, args=(), kwargs=None):
+        if op == 'get' and name in QUEUE_ATTRIBUTES:
+            return getattr(self.queue, name)
+        if op == 'call' and name in QUEUE_METHODS:
+            return getattr(self.queue, name)(*args, **(kwargs or {}))
+        if op == 'metrics':
+            return registry.render(names=QUEUE_METRICS)
+        raise ValueError(f"Unknown request {op} {name}")
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if not valid_request(request):
+                    logger.error(f"Malformed request {request!r:.100}")
+                    reply = ('error', "ValueError: Malformed request")
+                else:
+                    try:
+                        reply = ('ok', self.dispatch(*request))
+                    except Exception as e:
+                        logger.error(f"Error handling {request[:2]}: {e}")
+                        reply = ('error', f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def serve_forever(self):
+        unix = isinstance(self.address, str)
+        if unix and os.path.exists(self.address):
+            if socket_in_use(self.address):
+                raise RuntimeError(f"Another fetch daemon is listening on {self.address}")
+            os.remove(self.address)  # Left behind by a daemon that did not shut down cleanly
+
+        # Owner-only from the moment the socket exists, not just after a chmod
+        umask = os.umask(0o177) if unix else None
+        try:
+            listener = Listener(self.address, authkey=self.authkey)
+        finally:
+            if unix:
+                os.umask(umask)
+        with listener:
+            logger.info(f"Fetch daemon listening on {self.address}")
+            threading.Thread(target=self.queue.warm_up, name='reddit-warm-up', daemon=True).start()
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # Failed handshake, wrong authkey
+                    logger.warning(f"Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), name='fetch-daemon-conn', daemon=True).start()
+
+
+def valid_request(request):
+    """('get', name), ('call', name, args, kwargs) or ('metrics',), as sent by RemoteQueue"""
+    if not isinstance(request, tuple) or not 1 <= len(request) <= 4 or not isinstance(request[0], str):
+        return False
+    if len(request) > 1 and not isinstance(request[1], str):
+        return False
+    if len(request) > 2 and not isinstance(request[2], (tuple, list)):
+        return False
+    return len(request) < 4 or isinstance(request[3], (dict, type(None)))
+
+
+def socket_in_use(path):
+    """True if something accepts connections on the Unix socket at path"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class RemoteQueue:
+    """Stand-in for RedditQueue in a web worker, backed by a FetchDaemon.
+
+    Supports what the routes use: ``post_at``, ``window``, ``get_progress``
+    and the feed attributes, each read from the daemon's current queue.
+    Prefetching is the daemon's job, so ``warm_up`` and ``stop_prefetch`` do
+    nothing here. Each thread keeps its own connection and reconnects once
+    if the daemon was restarted.
+    """
+
+    def __init__(self, address=DAEMON_ADDRESS, authkey=None):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+        return conn
+
+    def _request(self, *request):
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send(request)
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                self._local.conn = None
+                if attempt:
+                    raise ConnectionError(f"Fetch daemon at {self.address} is unavailable: {e}")
+        if status == 'error':
+            raise RuntimeError(f"Fetch daemon: {result}")
+        return result
+
+    def _call(self, name, *args, **kwargs):
+        return self._request('call', name, args, kwargs)
+
+    @property
+    def generation(self):
+        return self._request('get', 'generation')
+
+    @property
+    def feed_head(self):
+        return self._request('get', 'feed_head')
+
+    @property
+    def buffer_size(self):
+        return self._request('get', 'buffer_size')
+
+    @property
+    def ready_timeout(self):
+        return self._request('get', 'ready_timeout')
+
+    @property
+    def subreddits(self):
+        return self._request('get', 'subreddits')
+
+    def post_at(self, seq, timeout=None):
+        return self._call('post_at', seq, timeout)
+
+    def window(self, start, count, timeout=None):
+        return self._call('window', start, count, timeout)
+
+    def get_progress(self):
+        return self._call('get_progress')
+
+    def get_current_posts(self):
+        return self._call('get_current_posts')
+
+    def reload_subreddits(self):
+        """Have the daemon apply a changed subreddits.json; returns (added, removed)"""
+        return self._call('reload_subreddits')
+
+    def metrics(self):
+        """The daemon's fetch metrics in the Prometheus text format"""
+        return self._request('metrics')
+
+    def warm_up(self):
+        pass
+
+    def stop_prefetch(self):
+        pass
+
+
+def exit_on_sigterm(signum, frame):
+    # Exit through sys.exit so the post cache is flushed at exit; a second
+    # SIGTERM must not interrupt that flush
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared fetch daemon for multi-process deployments')
+    parser.add_argument('--address', default=os.environ.get('FETCH_DAEMON', DAEMON_ADDRESS),
+                        help='Unix socket path or host:port (default: %(default)s)')
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    try:
+        daemon = FetchDaemon(args.address, authkey=daemon_authkey())
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Outcomes reported by RedditFetcher
+OK = 'ok'
+EMPTY = 'empty'
+NOT_FOUND = 'not_found'  # Banned, deleted or misspelled subreddit
+FORBIDDEN = 'forbidden'  # Private or quarantined subreddit
+ERROR = 'error'
+
+
+class SubredditHealth:
+    """Recent fetch outcomes per subreddit, used to skip known-bad ones.
+
+    Every failure puts the subreddit on a cooldown during which the queue
+    skips it without a network request. Empty listings and transient errors
+    back off exponentially from ``base_cooldown``; 404s and 403s go straight
+    to ``max_cooldown``. A success clears the cooldown. ``score`` is a 0..1
+    summary of recent outcomes for ranking subreddits.
+    """
+
+    def __init__(self, base_cooldown=60, max_cooldown=3600):
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, subreddit):
+        return self.stats.setdefault(subreddit, {
+            'score': 1.0,
+            'failures': 0,
+            'skip_until': 0.0,
+            'last_outcome': None,
+        })
+
+    def record(self, subreddit, outcome):
+        with self._lock:
+            entry = self._entry(subreddit)
+            entry['last_outcome'] = outcome
+            if outcome == OK:
+                entry['failures'] = 0
+                entry['skip_until'] = 0.0
+                entry['score'] = min(1.0, entry['score'] + 0.25)
+                return
+
+            entry['failures'] += 1
+            if outcome in (NOT_FOUND, FORBIDDEN):
+                cooldown = self.max_cooldown
+                entry['score'] = 0.0
+            else:
+                cooldown = min(self.base_cooldown * 2 ** (entry['failures'] - 1), self.max_cooldown)
+                entry['score'] *= 0.5
+            entry['skip_until'] = time.time() + cooldown
+            logger.info(f"r/{subreddit} {outcome}, skipping it for {cooldown:.0f}s")
+
+    def is_available(self, subreddit):
+        with self._lock:
+            entry = self.stats.get(subreddit)
+            return not entry or time.time() >= entry['skip_until']
+
+    def score(self, subreddit):
+        with self._lock:
+            entry = self.stats.get(subreddit)
+            return entry['score'] if entry else 1.0
+
+    def unavailable(self):
+        """Subreddits currently on cooldown"""
+        now = time.time()
+        with self._lock:
+            return [sub for sub, entry in self.stats.items() if now < entry['skip_until']]
+
+    def forget(self, subreddit):
+        with self._lock:
+            self.stats.pop(subreddit, None)
@@ -0,0 +1,126 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, listings are then parsed child by child with json
+    orjson = None
+
+# Fields of a listing child read by RedditFetcher (extract_post_data, the
+# seen and stickied checks, fetch_batch) and MediaResolver.resolve. A child
+# carries about a hundred more, plus award and flair blobs, none of them used.
+POST_FIELDS = (
+    'name', 'title', 'permalink', 'url', 'score', 'subreddit', 'thumbnail', 'author', 'num_comments',
+    'selftext', 'is_self', 'created_utc', 'domain', 'post_hint', 'is_video', 'media', 'stickied',
+    'preview', 'is_gallery', 'media_metadata', 'gallery_data', 'crosspost_parent_list',
+)
+CROSSPOST_FIELDS = ('is_video', 'media', 'url')
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def project(post_data):
+    """Copy of a listing child's data with only the fields a Post is built from"""
+    projected = {key: post_data[key] for key in POST_FIELDS if key in post_data}
+    parents = projected.get('crosspost_parent_list')
+    if parents:
+        projected['crosspost_parent_list'] = [
+            {key: parent[key] for key in CROSSPOST_FIELDS if key in parent}
+            for parent in parents[:1] if isinstance(parent, dict)
+        ]
+    return projected
+
+
+def _project_child(child):
+    if isinstance(child, dict) and isinstance(child.get('data'), dict):
+        return {'data': project(child['data'])}
+    return None
+
+
+def parse_listing(content):
+    """Parse a listing response body into {'data': {'after', 'before', 'children'}}.
+
+    Every child is reduced to POST_FIELDS as soon as it is parsed. With
+    orjson installed the body is parsed in one go, well ahead of the json
+    module; without it, children are decoded one at a time, so the full
+    tree of a page never has to be in memory at once. Raises ValueError for
+    a body that is not a listing.
+    """
+    if orjson is not None:
+        data = orjson.loads(content)
+        listing = data.get('data') if isinstance(data, dict) else None
+        if not isinstance(listing, dict):
+            raise ValueError("Response is not a listing")
+        children = (_project_child(child) for child in listing.get('children') or [])
+        return {'data': {'after': listing.get('after'), 'before': listing.get('before'),
+                         'children': [child for child in children if child]}}
+
+    text = content.decode('utf-8') if isinstance(content, bytes) else content
+    listing = {'after': None, 'before': None}
+
+    def on_child(index):
+        child, index = _decoder.raw_decode(text, index)
+        child = _project_child(child)
+        if child:
+            listing['children'].append(child)
+        return index
+
+    def on_listing_member(key, index):
+        if key == 'children':
+            return _walk_array(text, index, on_child)
+        value, index = _decoder.raw_decode(text, index)
+        if key in ('after', 'before'):
+            listing[key] = value
+        return index
+
+    def on_root_member(key, index):
+        if key == 'data' and text[index] == '{':
+            listing['children'] = []
+            return _walk_object(text, index, on_listing_member)
+        return _decoder.raw_decode(text, index)[1]
+
+    try:
+        _walk_object(text, 0, on_root_member)
+    except IndexError:
+        raise ValueError("Truncated listing")
+    if 'children' not in listing:
+        raise ValueError("Response is not a listing")
+    return {'data': listing}
+
+
+def _walk_object(text, index, on_member):
+    """Walk the JSON object at text[index]; on_member(key, index) consumes each value.
+
+    Returns the index just past the object.
+    """
+    index = _expect(text, index, '{')
+    if text[index] == '}':
+        return index + 1
+    while True:
+        key, index = _decoder.raw_decode(text, index)
+        index = _expect(text, index, ':')
+        index = _whitespace.match(text, on_member(key, index)).end()
+        if text[index] == '}':
+            return index + 1
+        index = _expect(text, index, ',')
+
+
+def _walk_array(text, index, on_item):
+    """Walk the JSON array at text[index]; on_item(index) consumes each element"""
+    index = _expect(text, index, '[')
+    if text[index] == ']':
+        return index + 1
+    while True:
+        index = _whitespace.match(text, on_item(index)).end()
+        if text[index] == ']':
+            return index + 1
+        index = _expect(text, index, ',')
+
+
+def _expect(text, index, char):
+    """Index of the next token after char, which must come next"""
+    index = _whitespace.match(text, index).end()
+    if text[index] != char:
+        raise ValueError(f"Expected {char!r} at position {index}")
+    return _whitespace.match(text, index + 1).end()
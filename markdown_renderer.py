@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+
+from metrics import MARKDOWN_SECONDS
+
+# Patterns are compiled once at import. Each pass below is guarded by cheap
+# substring tests for literals its pattern cannot match without, so text that
+# has no markup of a given kind skips that regex entirely.
+NUMBERED_ITEM = re.compile(r'^\s*(\d+)\.\s+(.+)$')
+
+INLINE_PASSES = [
+    # Headers
+    (('# ',), re.compile(r'(?m)^# (.*?)$'), r'<h1>\1</h1>'),
+    (('## ',), re.compile(r'(?m)^## (.*?)$'), r'<h2>\1</h2>'),
+    (('### ',), re.compile(r'(?m)^### (.*?)$'), r'<h3>\1</h3>'),
+    # Bold and Italic
+    (('***',), re.compile(r'\*\*\*(.*?)\*\*\*'), r'<strong><em>\1</em></strong>'),
+    (('**',), re.compile(r'\*\*(.*?)\*\*'), r'<strong>\1</strong>'),
+    (('*',), re.compile(r'\*(.*?)\*'), r'<em>\1</em>'),
+    # Strikethrough
+    (('~~',), re.compile(r'~~(.*?)~~'), r'<del>\1</del>'),
+    # Spoilers
+    (('>!',), re.compile(r'>!(.*?)!<'), r'<span class="spoiler">\1</span>'),
+    # Unordered lists
+    (('* ', '- '), re.compile(r'(?m)^[*-] (.*?)$'), r'<ul><li>\1</li></ul>'),
+    # Blockquotes
+    (('> ',), re.compile(r'(?m)^> (.*?)$'), r'<blockquote>\1</blockquote>'),
+    # Code blocks
+    (('```',), re.compile(r'```(.*?)```', re.DOTALL), r'<pre><code>\1</code></pre>'),
+    (('`',), re.compile(r'`(.*?)`'), r'<code>\1</code>'),
+    # Links - handle both [text](url) and plain URLs
+    (('](',), re.compile(r'\[([^\]]+)\]\(([^\)]+)\)'),
+     r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>'),
+    (('http',), re.compile(r'(?<!href=")(?<![\(\[])(https?://[^\s\)<>]+)'),
+     r'<a href="\1" target="_blank" rel="noopener noreferrer">\1</a>'),
+]
+
+SUPERSCRIPT = re.compile(r'\^(.*?)(?=\s|$)')
+
+
+def render_numbered_lists(text):
+    """Strip every line and wrap runs of "1. item" lines in <ol> blocks"""
+    in_list = False
+    processed_lines = []
+    current_list_number = 0
+
+    for line in text.split('\n'):
+        line = line.strip()
+        # A list item has to start with a digit, skip the regex otherwise
+        list_match = NUMBERED_ITEM.match(line) if line[:1].isdecimal() else None
+
+        if list_match:
+            number = int(list_match.group(1))
+
+            # Start new list only if we're not in one or if number is less than current
+            if not in_list or number <= current_list_number:
+                if in_list:
+                    processed_lines.append('</ol>')
+                processed_lines.append('<ol>')
+                in_list = True
+
+            current_list_number = number
+            processed_lines.append(f'<li>{list_match.group(2)}</li>')
+        elif line != '' and in_list:
+            # Non-empty, non-list line ends the list
+            in_list = False
+            processed_lines.append('</ol>')
+            processed_lines.append(line)
+        else:
+            processed_lines.append(line)
+
+    if in_list:
+        processed_lines.append('</ol>')
+
+    return '\n'.join(processed_lines)
+
+
+@lru_cache(maxsize=2048)
+@MARKDOWN_SECONDS.time()
+def render_markdown(text):
+    """Convert Reddit selftext markdown to HTML.
+
+    Results are memoized on the text itself, so a post that is extracted
+    again (cache refresh, duplicate listing) is not rendered twice.
+    """
+    if not text:
+        return text
+
+    html = render_numbered_lists(text)
+
+    for literals, pattern, replacement in INLINE_PASSES:
+        if any(literal in html for literal in literals):
+            html = pattern.sub(replacement, html)
+
+    # Line breaks
+    html = html.replace('\n\n', '<br><br>')
+
+    # Superscript
+    if '^' in html:
+        html = SUPERSCRIPT.sub(r'<sup>\1</sup>', html)
+
+    return html
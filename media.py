@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# Extensions served straight as images by <img>
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def unescape_url(url):
+    """Listing JSON HTML-escapes the ampersands in media URLs"""
+    if not url:
+        return url
+    return url.replace('&amp;', '&')
+
+
+def is_image_url(url):
+    return bool(url) and url.lower().split('?')[0].endswith(IMAGE_EXTENSIONS)
+
+
+class MediaResolver:
+    """Picks what media a post shows and checks that it loads.
+
+    ``resolve`` works on the raw listing data only: it chooses the smallest
+    preview or gallery rendition that is at least ``target_width`` pixels
+    wide instead of the full-size original, and records its dimensions so
+    the page can reserve space before the image arrives. Every rendition
+    also goes into a ``srcset`` string, from which the browser picks the
+    one that fits its viewport; the chosen rendition is the fallback
+    ``src``. ``preflight`` sends a HEAD request for a post's main media and
+    remembers the answer for ``check_ttl`` seconds; it is meant for the
+    prefetch workers, off the request path.
+    """
+
+    def __init__(self, target_width=1080, check_ttl=3600, max_checks=4096, head_timeout=3, session=None):
+        self.target_width = target_width
+        self.check_ttl = check_ttl
+        self.max_checks = max_checks
+        self.head_timeout = head_timeout
+        self.session = session or requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        self.checks = OrderedDict()  # url -> (ok, checked_at)
+        self._lock = threading.Lock()
+
+    def pick(self, renditions):
+        """Smallest (url, width, height) at least target_width wide, else the largest"""
+        renditions = sorted((r for r in renditions if r[0]), key=lambda r: r[1] or 0)
+        if not renditions:
+            return None
+        for rendition in renditions:
+            if (rendition[1] or 0) >= self.target_width:
+                return rendition
+        return renditions[-1]
+
+    @staticmethod
+    def srcset(renditions):
+        """'url 108w, url 216w, ...' for the renditions with a known width"""
+        widths = {}
+        for url, width, _ in renditions:
+            if url and width:
+                widths.setdefault(width, url)
+        return ', '.join(f"{url} {width}w" for width, url in sorted(widths.items()))
+
+    def preview_renditions(self, post_data, url):
+        """(url, width, height) of every rendition of the post's preview image"""
+        images = (post_data.get('preview') or {}).get('images') or []
+        if not images:
+            return []
+        image = images[0]
+        if url.lower().split('?')[0].endswith('.gif'):
+            # Plain renditions of a GIF are still frames, use the animated variant
+            image = (image.get('variants') or {}).get('gif')
+            if not image:
+                return []
+        renditions = [(unescape_url(r.get('url')), r.get('width'), r.get('height'))
+                      for r in image.get('resolutions') or []]
+        source = image.get('source') or {}
+        renditions.append((unescape_url(source.get('url')), source.get('width'), source.get('height')))
+        return renditions
+
+    def preview_image(self, post_data, url):
+        """Best rendition of the post's preview image, or None"""
+        return self.pick(self.preview_renditions(post_data, url))
+
+    def gallery_renditions(self, media_info):
+        """(url, width, height) of every rendition of one media_metadata entry"""
+        if media_info.get('status', 'valid') != 'valid':
+            return []
+        renditions = [(unescape_url(p.get('u')), p.get('x'), p.get('y')) for p in media_info.get('p') or []]
+        source = media_info.get('s') or {}
+        # Animated gallery items have no 'u', only 'gif'/'mp4'
+        renditions.append((unescape_url(source.get('u') or source.get('gif')), source.get('x'), source.get('y')))
+        if not source.get('u') and source.get('gif'):
+            # The 'p' renditions of an animated item are still frames
+            renditions = renditions[-1:]
+        return renditions
+
+    def gallery_image(self, media_info):
+        """Best rendition of one media_metadata entry, or None"""
+        return self.pick(self.gallery_renditions(media_info))
+
+    def resolve(self, post_data, url, media, is_video):
+        """Media fields for a Post built from raw listing data
+
+        url, media and is_video come from the crosspost parent when there is one.
+        """
+        resolved = {
+            'media_url': '',
+            'dash_url': None,
+            'preview_url': '',
+            'preview_srcset': '',
+            'gallery_images': [],
+            'gallery_sizes': [],
+            'gallery_srcsets': [],
+            'media_width': 0,
+            'media_height': 0,
+        }
+
+        reddit_video = media.get('reddit_video') if is_video and isinstance(media, dict) else None
+        if reddit_video:
+            resolved['media_url'] = unescape_url(reddit_video.get('fallback_url', ''))
+            dash_url = reddit_video.get('dash_url')
+            if not dash_url and resolved['media_url']:
+                # Construct DASH URL from fallback URL if not provided
+                dash_url = f"{resolved['media_url'].split('DASH_')[0]}DASHPlaylist.mpd"
+            resolved['dash_url'] = unescape_url(dash_url) if dash_url else None
+            resolved['media_width'] = reddit_video.get('width') or 0
+            resolved['media_height'] = reddit_video.get('height') or 0
+
+        if post_data.get('is_gallery', False):
+            media_metadata = post_data.get('media_metadata') or {}
+            # gallery_data keeps the author's order, media_metadata does not
+            items = (post_data.get('gallery_data') or {}).get('items') or []
+            media_ids = [item.get('media_id') for item in items] or list(media_metadata)
+            for media_id in media_ids:
+                media_info = media_metadata.get(media_id) or {}
+                if media_info.get('e') not in ('Image', 'AnimatedImage'):
+                    continue
+                renditions = self.gallery_renditions(media_info)
+                picked = self.pick(renditions)
+                if picked:
+                    resolved['gallery_images'].append(picked[0])
+                    resolved['gallery_sizes'].append((picked[1] or 0, picked[2] or 0))
+                    resolved['gallery_srcsets'].append(self.srcset(renditions))
+            if resolved['gallery_sizes']:
+                resolved['media_width'], resolved['media_height'] = resolved['gallery_sizes'][0]
+
+        if not reddit_video and not resolved['gallery_images'] and not post_data.get('is_self', False):
+            resolved['media_url'] = unescape_url(url) if url else ''
+            renditions = self.preview_renditions(post_data, url or '')
+            picked = self.pick(renditions)
+            if picked:
+                resolved['preview_url'] = picked[0]
+                resolved['preview_srcset'] = self.srcset(renditions)
+                resolved['media_width'] = picked[1] or 0
+                resolved['media_height'] = picked[2] or 0
+
+        return resolved
+
+    def primary_url(self, post):
+        """The media URL the page loads first for a post"""
+        if post.is_video and post.dash_url:
+            return post.dash_url
+        if post.gallery_images:
+            return post.gallery_images[0]
+        if post.preview_url:
+            return post.preview_url
+        if is_image_url(post.external_url):
+            return post.external_url
+        return ''
+
+    def check(self, url):
+        """True unless a HEAD request says the URL is gone; answers are cached"""
+        now = time.time()
+        cached = self._cached(url, now)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self.session.head(url, timeout=self.head_timeout, allow_redirects=True)
+        except requests.RequestException as e:
+            logger.debug(f"HEAD {url} failed: {e}")
+            return True  # Let the browser try, don't cache a network hiccup
+        return self._remember(url, self._loads(response.status_code, response.url), now)
+
+    async def check_async(self, url, head):
+        """check for the async fetcher; head(url) is a coroutine returning a response, None on failure"""
+        now = time.time()
+        cached = self._cached(url, now)
+        if cached is not None:
+            return cached
+
+        response = await head(url)
+        if response is None:
+            return True
+        return self._remember(url, self._loads(response.status_code, str(response.url)), now)
+
+    @staticmethod
+    def _loads(status_code, final_url):
+        # Only a definite answer marks media broken; rate limits and 5xx do not
+        if status_code in (403, 404, 410):
+            return False
+        # i.redd.it redirects deleted images to a placeholder
+        return not (status_code == 200 and '/removed.png' in final_url)
+
+    def _cached(self, url, now):
+        with self._lock:
+            cached = self.checks.get(url)
+            if cached and now - cached[1] < self.check_ttl:
+                self.checks.move_to_end(url)
+                return cached[0]
+        return None
+
+    def _remember(self, url, ok, now):
+        with self._lock:
+            self.checks[url] = (ok, now)
+            self.checks.move_to_end(url)
+            while len(self.checks) > self.max_checks:
+                self.checks.popitem(last=False)
+        return ok
+
+    def preflight(self, post):
+        """Mark the post's media broken if its main URL no longer loads"""
+        url = self.primary_url(post)
+        if url and not self.check(url):
+            self._mark_broken(post, url)
+        return post.media_ok
+
+    async def preflight_async(self, post, head):
+        url = self.primary_url(post)
+        if url and not await self.check_async(url, head):
+            self._mark_broken(post, url)
+        return post.media_ok
+
+    def _mark_broken(self, post, url):
+        logger.info(f"Broken media for r/{post.subreddit} post {post.key}: {url}")
+        post.media_ok = False
+
+
+# One resolver for the whole process, so HEAD answers are shared
+shared_media = MediaResolver()
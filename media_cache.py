@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from media import USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_DIR = 'media_cache'
+DOWNLOAD_PREFIX = '.download-'  # Temp files of downloads in progress
+
+# Only Reddit's own CDNs are proxied, the proxy must not fetch arbitrary URLs
+PROXY_HOSTS = ('i.redd.it', 'preview.redd.it', 'external-preview.redd.it', 'v.redd.it',
+               'a.thumbs.redditmedia.com', 'b.thumbs.redditmedia.com')
+
+class MediaCache:
+    """Bounded on-disk cache behind the /media/<key> proxy route.
+
+    ``proxy_url`` registers a Reddit CDN URL and returns the local URL for
+    it; the key is a hash of the original URL, so the same image always maps
+    to the same file. ``fetch`` downloads a registered URL once, streaming it
+    into the cache directory, and returns the file path for ``send_file``.
+    The least recently used files are deleted once the directory grows past
+    ``max_bytes``, and only the ``max_urls`` most recently handed out keys
+    are remembered. Images are not resized here: the page picks a small
+    rendition from Reddit's own through ``srcset`` (see media.py).
+    """
+
+    def __init__(self, path=MEDIA_CACHE_DIR, max_bytes=512 * 1024 * 1024, max_file_bytes=64 * 1024 * 1024,
+                 max_urls=20000, timeout=10, session=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_urls = max_urls
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        self.urls = OrderedDict()  # key -> original URL, least recently handed out first
+        self.files = OrderedDict()  # key -> (file name, size), least recently used first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.path, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.startswith(DOWNLOAD_PREFIX):
+                # Left behind by a process that died mid-download
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    logger.error(f"Error removing {entry.name} from media cache: {e}")
+            elif entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name.split('.')[0]] = (name, size)
+            self.total_bytes += size
+        logger.info(f"Media cache has {len(self.files)} files, {self.total_bytes // 1024} KB")
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def can_proxy(self, url):
+        return bool(url) and urlsplit(url).hostname in PROXY_HOSTS and not url.split('?')[0].endswith('.mpd')
+
+    def proxy_url(self, url):
+        """Local URL serving url through the cache, or url itself if it is not proxied"""
+        if not self.can_proxy(url):
+            return url
+        key = self.key_for(url)
+        with self._lock:
+            self.urls[key] = url
+            self.urls.move_to_end(key)
+            while len(self.urls) > self.max_urls:
+                self.urls.popitem(last=False)
+        return f"/media/{key}"
+
+    def original_url(self, key):
+        """The Reddit URL a key was handed out for, or None if it was never seen or forgotten"""
+        with self._lock:
+            return self.urls.get(key)
+
+    def proxy_srcset(self, srcset):
+        """srcset with every URL passed through proxy_url"""
+        if not srcset:
+            return srcset
+        candidates = (candidate.rsplit(' ', 1) for candidate in srcset.split(', '))
+        return ', '.join(f"{self.proxy_url(url)} {width}" for url, width in candidates)
+
+    def _find(self, key):
+        """File name cached for key, if any, marking it recently used"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.files.get(key)
+            if not entry:
+                return None
+            self.files.move_to_end(key)
+            return entry[0]
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def fetch(self, key):
+        """Path of the cached file for key, downloading it on first use; None if unavailable"""
+        name = self._find(key)
+        if name:
+            return os.path.abspath(os.path.join(self.path, name))
+
+        # One download per key; concurrent requests wait for it and then hit the cache
+        with self._key_lock(key):
+            name = self._find(key) or self._download(key)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return os.path.abspath(os.path.join(self.path, name)) if name else None
+
+    def _download(self, key):
+        url = self.original_url(key)
+        if not url:
+            return None
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    logger.warning(f"Media fetch {url} returned {response.status_code}")
+                    return None
+                content_type = response.headers.get('Content-Type', '').split(';')[0]
+                extension = mimetypes.guess_extension(content_type) or os.path.splitext(urlsplit(url).path)[1]
+                fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=DOWNLOAD_PREFIX)
+                size = 0
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=64 * 1024):
+                            size += len(chunk)
+                            if size > self.max_file_bytes:
+                                break
+                            f.write(chunk)
+                except BaseException:
+                    os.unlink(tmp_path)  # Broken off mid-body, don't leave the partial file behind
+                    raise
+                if size > self.max_file_bytes:
+                    os.remove(tmp_path)
+                    logger.info(f"Not caching {url}, larger than {self.max_file_bytes} bytes")
+                    return None
+        except (requests.RequestException, OSError) as e:
+            logger.error(f"Error fetching media {url}: {e}")
+            return None
+
+        name = f"{key}{extension}"
+        os.replace(tmp_path, os.path.join(self.path, name))
+        self._add(name, size)
+        return name
+
+    def _add(self, name, size):
+        stem = name.split('.')[0]
+        with self._lock:
+            _, old_size = self.files.pop(stem, (None, 0))
+            self.total_bytes += size - old_size
+            self.files[stem] = (name, size)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            _, (name, size) = self.files.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError as e:
+                logger.error(f"Error evicting {name} from media cache: {e}")
+            logger.debug(f"Evicted {name} from media cache")
+
+    def rewrite(self, data):
+        """Point a serialized post's media URLs at the proxy"""
+        data['thumbnail'] = self.proxy_url(data.get('thumbnail'))
+        data['preview_url'] = self.proxy_url(data.get('preview_url'))
+        data['preview_srcset'] = self.proxy_srcset(data.get('preview_srcset'))
+        data['external_url'] = self.proxy_url(data.get('external_url'))
+        data['media_url'] = self.proxy_url(data.get('media_url'))
+        data['gallery_images'] = [self.proxy_url(url) for url in data.get('gallery_images') or []]
+        data['gallery_srcsets'] = [self.proxy_srcset(srcset) for srcset in data.get('gallery_srcsets') or []]
+        return data
@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-millisecond) up to slow Reddit requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Prometheus-style histogram with optional labels.
+
+    Observations are bucketed as they arrive, so recording one is a bisect
+    and a few additions under a lock, and a scrape never walks raw samples.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.label_names, labels, [('le', _format_value(bound))])} {cumulative}")
+            yield f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', '+Inf')])} {values[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {values[-2]!r}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {values[-1]}"
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            return
+        yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Modules may be reloaded (Flask debug mode); keep the first instance
+            return self.metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, read):
+        """Register a gauge; a later registration under the same name replaces the callback"""
+        gauge = Gauge(name, documentation, read)
+        with self._lock:
+            self.metrics[name] = gauge
+        return gauge
+
+    def render(self, names=None, exclude=()):
+        """Metrics in the Prometheus text exposition format, all of them unless names is given"""
+        with self._lock:
+            metrics = [m for m in self.metrics.values()
+                       if (names is None or m.name in names) and m.name not in exclude]
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# One registry for the whole process, scraped through /metrics
+registry = Registry()
+
+FETCH_SECONDS = registry.histogram(
+    'reddit_fetch_seconds', 'Time spent on one Reddit listing request, excluding rate limit waits',
+    labels=('kind',))
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    'reddit_rate_limit_wait_seconds', 'Time a request waited for the rate limiter')
+EXTRACT_SECONDS = registry.histogram(
+    'reddit_extract_seconds', 'Time spent turning one listing child into a Post')
+MARKDOWN_SECONDS = registry.histogram(
+    'markdown_render_seconds', 'Time spent rendering selftext markdown, cache misses only')
+REQUEST_SECONDS = registry.histogram(
+    'http_request_seconds', 'Time to handle a request, up to the first byte for streams',
+    labels=('endpoint', 'status'))
+FETCH_ERRORS = registry.counter(
+    'reddit_fetch_errors_total', 'Listing requests that failed', labels=('kind',))
+
+# Recorded by whichever process runs the RedditQueue: the app itself, or
+# fetch_daemon.py when the app runs as several workers
+QUEUE_METRICS = frozenset(m.name for m in (FETCH_SECONDS, RATE_LIMIT_WAIT_SECONDS, EXTRACT_SECONDS, FETCH_ERRORS))
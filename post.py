@@ -0,0 +1,113 @@
+import json
+
+from markdown_renderer import render_markdown
+from media import is_image_url
+
+# Field name -> default, in the order posts are serialized
+POST_FIELDS = {
+    'id': '',  # Reddit fullname, e.g. t3_1h438mr
+    'title': '',
+    'url': '',
+    'score': '0',
+    'subreddit': '',
+    'media_url': '',
+    'preview_url': '',  # Downsized preview rendition, see media.MediaResolver
+    'preview_srcset': '',  # Every preview rendition, for <img srcset>
+    'media_width': 0,
+    'media_height': 0,
+    'media_ok': True,  # False once a HEAD check found the media gone
+    'gallery_images': (),
+    'gallery_sizes': (),  # (width, height) per gallery image
+    'gallery_srcsets': (),  # srcset per gallery image
+    'thumbnail': '',
+    'author': '[deleted]',
+    'num_comments': 0,
+    'selftext': '',
+    'is_self': False,
+    'created_utc': 0,
+    'domain': '',
+    'external_url': '',
+    'post_hint': '',
+    'is_video': False,
+    'dash_url': None,
+}
+
+
+class Post:
+    """A fetched post, stored in a slotted object instead of a 17-key dict.
+
+    ``selftext`` holds the raw markdown; ``selftext_html`` renders it the
+    first time it is read and keeps the result. Item access (``post['url']``,
+    ``post.get('url')``) is kept for code written against the old dicts.
+    """
+
+    __slots__ = tuple(POST_FIELDS) + ('_selftext_html',)
+
+    def __init__(self, **fields):
+        for name, default in POST_FIELDS.items():
+            setattr(self, name, fields.get(name, default))
+        self._selftext_html = fields.get('selftext_html')
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Post from a cached dict; unknown keys are ignored"""
+        return cls(**data)
+
+    @property
+    def key(self):
+        """Identity used for duplicate checks; legacy cached posts have no id"""
+        return self.id or self.url
+
+    @property
+    def selftext_html(self):
+        if self._selftext_html is None:
+            self._selftext_html = render_markdown(self.selftext or '')
+        return self._selftext_html
+
+    def to_dict(self):
+        """Plain dict for JSON, with selftext_html rendered on demand
+
+        is_image is decided from the original external_url, which the media
+        proxy may rewrite to an extensionless /media/<key>.
+        """
+        data = {name: getattr(self, name) for name in POST_FIELDS}
+        data['gallery_images'] = list(self.gallery_images)
+        data['gallery_sizes'] = [list(size) for size in self.gallery_sizes]
+        data['gallery_srcsets'] = list(self.gallery_srcsets)
+        data['selftext_html'] = self.selftext_html
+        data['is_image'] = is_image_url(self.external_url)
+        return data
+
+    def to_cache_dict(self):
+        """Like to_dict, but without the rendered HTML"""
+        data = {name: getattr(self, name) for name in POST_FIELDS}
+        data['gallery_images'] = list(self.gallery_images)
+        data['gallery_sizes'] = [list(size) for size in self.gallery_sizes]
+        data['gallery_srcsets'] = list(self.gallery_srcsets)
+        return data
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def __getitem__(self, key):
+        if key in POST_FIELDS or key == 'selftext_html':
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in POST_FIELDS or key == 'selftext_html'
+
+    def __eq__(self, other):
+        return isinstance(other, Post) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"Post(r/{self.subreddit}: {self.title[:40]!r})"
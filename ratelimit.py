@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+import logging
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Thread-safe token bucket that follows Reddit's rate-limit headers.
+
+    Every request takes one token. Tokens refill at ``rate`` per second up to
+    ``capacity``. Reddit's ``X-Ratelimit-Remaining``/``X-Ratelimit-Reset``
+    headers retune the refill rate to whatever budget is actually left, and a
+    429 (with or without ``Retry-After``) halves the rate and blocks everyone
+    until the back-off expires.
+    """
+
+    def __init__(self, rate=1 / 3, capacity=3, min_rate=1 / 30, max_rate=2.0,
+                 backoff_base=5, backoff_max=300):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+        self.remaining = None
+        self.reset_at = None
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.rate_limited = 0
+        self.waits = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _try_take(self, waited):
+        """Take a token if one is available; otherwise return how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.requests += 1
+                if waited:
+                    self.waits += 1
+                    self.total_wait += waited
+                return None
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait = self._try_take(waited)
+            if wait is None:
+                return waited
+            logger.debug(f"Rate limiter sleeping {wait:.2f}s")
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self):
+        """Same as acquire, but yields to the event loop while waiting"""
+        waited = 0.0
+        while True:
+            wait = self._try_take(waited)
+            if wait is None:
+                return waited
+            logger.debug(f"Rate limiter sleeping {wait:.2f}s")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def record_response(self, status_code, headers):
+        """Feed a response's status and headers back into the limiter"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._apply_headers(now, headers)
+
+            if status_code == 429:
+                self.rate_limited += 1
+                self.consecutive_limited += 1
+                delay = self._retry_after(headers)
+                if delay is None:
+                    delay = min(self.backoff_base * 2 ** (self.consecutive_limited - 1),
+                                self.backoff_max)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, now + delay)
+                logger.warning(f"Rate limited by Reddit, backing off {delay:.1f}s "
+                               f"(rate now {self.rate:.3f} req/s)")
+            else:
+                self.consecutive_limited = 0
+                if self.remaining is None and self.rate < self.base_rate:
+                    # No budget information, creep back towards the configured rate
+                    self.rate = min(self.base_rate, self.rate * 1.25)
+
+    def _apply_headers(self, now, headers):
+        remaining = _header_float(headers, 'X-Ratelimit-Remaining')
+        reset = _header_float(headers, 'X-Ratelimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        self.remaining = remaining
+        self.reset_at = now + reset
+        if remaining < 1:
+            # Budget exhausted for this window, wait for the reset
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + reset)
+        else:
+            allowed = remaining / max(reset, 1.0)
+            self.rate = max(self.min_rate, min(self.max_rate, allowed))
+
+    def _retry_after(self, headers):
+        value = headers.get('Retry-After') if headers else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def metrics(self):
+        """Snapshot of the limiter state for progress/diagnostics output"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'rate': round(self.rate, 4),
+                'tokens': round(self.tokens, 2),
+                'requests': self.requests,
+                'rate_limited': self.rate_limited,
+                'waits': self.waits,
+                'total_wait': round(self.total_wait, 2),
+                'blocked_for': round(max(0.0, self.blocked_until - now), 2),
+                'remaining': self.remaining,
+                'reset_in': round(max(0.0, self.reset_at - now), 2) if self.reset_at else None,
+            }
+
+
+def _header_float(headers, name):
+    value = headers.get(name) if headers else None
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# One limiter for the whole process: every RedditFetcher draws from it
+shared_limiter = RateLimiter()
@@ -4,83 +4,384 @@ import concurrent.futures
 import time
 import json
 import logging
+import threading
+import uuid
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from random import uniform, choice
 import os
 from datetime import datetime, timedelta
 from fake_useragent import UserAgent
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from requests.adapters import HTTPAdapter
+from ratelimit import shared_limiter
+from cache import shared_cache
+from seen import shared_seen
+import health
+from health import SubredditHealth
+from post import Post
+from media import shared_media, unescape_url
+from listing import parse_listing
+from scheduler import WeightedScheduler, SCHEDULERS
+from metrics import FETCH_SECONDS, RATE_LIMIT_WAIT_SECONDS, EXTRACT_SECONDS, FETCH_ERRORS
+
+# Configure logging; LOG_LEVEL=DEBUG turns on the verbose per-post output
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 SUBREDDITS_FILE = 'subreddits.json'
+REDDIT_BASE_URL = 'https://www.reddit.com'
+MAX_URL_LENGTH = 2000  # Keep multireddit URLs well under common server limits
+NOT_MODIFIED = 'not_modified'  # get_listing result for a 304 to a conditional request
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
 
 class RedditFetcher:
-    def __init__(self):
+    is_async = False  # AsyncRedditFetcher runs the queue's prefetches on its event loop
+
+    def __init__(self, rate_limiter=None, cache=None, seen=None, health=None, pool_size=10, media=None,
+                 base_url=REDDIT_BASE_URL):
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'gzip, deflate',
         })
-        self.last_request_time = None
-        self.min_request_interval = 3
+        # Keep-alive connections for every prefetch worker instead of the default 10/10
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = rate_limiter or shared_limiter
+        self.cache = cache or shared_cache
+        self.seen = seen if seen is not None else shared_seen
+        self.health = health or SubredditHealth()
+        self.media = media or shared_media
+        self.base_url = base_url.rstrip('/')  # Pointed at a local stand-in by the benchmarks
+        self.page_size = 25  # Posts requested per listing page
+        self.page_budget = 3  # Listing pages get_post may walk past already-seen posts
+        self.watermark_max_age = 6 * 3600  # Seconds without a new top post before before= is distrusted
+        self.max_retries = 3
         self.timeout = 5  # Reduced timeout from 10 to 5 seconds
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reddit-refresh')
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
 
     def get_post(self, subreddit):
-        if self.last_request_time:
-            elapsed = time.time() - self.last_request_time
-            if elapsed < self.min_request_interval:
-                sleep_time = self.min_request_interval - elapsed
-                logger.debug(f"Sleeping for {sleep_time:.2f} seconds to respect rate limits.")
-                time.sleep(sleep_time)
-
-        url = f"https://www.reddit.com/r/{subreddit}/hot.json?limit=1"
-        
-        try:
-            self.last_request_time = time.time()
-            response = self.session.get(url, timeout=self.timeout)
-            
-            if response.status_code == 429:  # Rate limit
-                logger.warning(f"Rate limit hit for r/{subreddit}, waiting...")
-                time.sleep(self.min_request_interval * 2)
-                return None
-                
-            if response.status_code != 200:
-                logger.error(f"Error fetching r/{subreddit}: Status code {response.status_code}")
-                return None
+        """Return the next unseen post for the subreddit.
+
+        Posts come from the subreddit's reservoir in the cache; the network is
+        only hit when the reservoir is empty, and then a whole page is fetched,
+        continuing from the stored ``after`` cursor while the entry is fresh.
+        A page whose posts were all seen already is followed by the next one,
+        up to ``page_budget`` pages per call (see next_page). Posts in the
+        seen index are dropped on the way out. A stale reservoir
+        is topped up in the background with only the posts that are new since
+        the last fetch (see ``refresh_page``).
+        """
+        post, fresh = self.pop_unseen(subreddit)
+        if post:
+            if not fresh:
+                self.refresh_in_background(subreddit)
+            logger.debug(f"Reservoir hit for r/{subreddit} (fresh={fresh})")
+            return post
+
+        after = self.cache.cursor(subreddit) if self.cache.is_fresh(subreddit) else None
+        for _ in range(self.page_budget):
+            posts, data = self.fetch_page_data(subreddit, after=after)
+            more, after = self.next_page(posts, data, after)
+            if not more:
+                break
+        post, _ = self.pop_unseen(subreddit)
+        return post
+
+    def next_page(self, posts, data, after):
+        """(more, after) for get_post once a page was fetched from after
+
+        Only a page that gave no new posts is followed: by its own ``after``
+        while the listing goes on, from the top (None) once it ended.
+        """
+        if posts is None or posts:
+            return False, after
+        listing = data.get('data') or {}
+        if listing.get('children') and listing.get('after'):
+            return True, listing['after']  # Every post on the page was seen already
+        if after:
+            return True, None  # Reached the end of the listing, start over from the top
+        return False, None
+
+    def pop_unseen(self, subreddit):
+        while True:
+            post, fresh = self.cache.pop(subreddit)
+            if not post or post.key not in self.seen:
+                return post, fresh
+
+    def is_seen(self, post_data):
+        """Check a raw listing child against the seen index before extracting it"""
+        return post_data.get('name') in self.seen
+
+    def refresh_in_background(self, subreddit):
+        """Refetch a stale subreddit's first page without blocking the caller"""
+        with self._refresh_lock:
+            if subreddit in self._refreshing:
+                return
+            self._refreshing.add(subreddit)
+
+        def refresh():
+            try:
+                self.refresh_page(subreddit)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(subreddit)
+
+        self._refresh_executor.submit(refresh)
+
+    def get_listing(self, path, label, subreddit=None, validators=None):
+        """GET a listing under /r/, retrying 429s through the rate limiter.
+
+        Returns the parsed JSON, or None on any error. Failures of a single
+        subreddit's listing are recorded in its health. With ``validators``
+        (the ETag and Last-Modified of an earlier response) the request is
+        conditional; see read_listing.
+        """
+        url = f"{self.base_url}/r/{path}"
+        kind = 'page' if subreddit else 'batch'
+        headers = conditional_headers(validators)
+        for attempt in range(self.max_retries + 1):
+            RATE_LIMIT_WAIT_SECONDS.observe(self.rate_limiter.acquire())
+            with FETCH_SECONDS.time(kind):
+                response = self.session.get(url, timeout=self.timeout, headers=headers)
+            self.rate_limiter.record_response(response.status_code, response.headers)
+
+            if response.status_code != 429:
+                break
+            logger.warning(f"Rate limit hit for {label} (attempt {attempt + 1}/{self.max_retries + 1})")
+        else:
+            FETCH_ERRORS.inc(kind)
+            return None
 
-            data = response.json()
-            
-            if not data.get('data', {}).get('children'):
-                logger.info(f"No posts found in r/{subreddit}")
-                return None
+        return self.read_listing(response, label, subreddit, validators)
 
-            posts = data['data']['children']
-            for post in posts:
-                post_data = post.get('data')
-                if post_data and not post_data.get('stickied', False):
-                    extracted_data = self.extract_post_data(post_data, subreddit)
-                    if extracted_data:
-                        return extracted_data
-            
+    def read_listing(self, response, label, subreddit=None, validators=None):
+        """Parsed listing (see listing.parse_listing), NOT_MODIFIED for a 304, None if unusable
+
+        validators, when given, is updated with the response's ETag and
+        Last-Modified for the next conditional request.
+        """
+        if response.status_code == 304:
+            return NOT_MODIFIED
+
+        if not self.check_response(response.status_code, response.url, label, subreddit):
+            FETCH_ERRORS.inc('page' if subreddit else 'batch')
             return None
 
+        if validators is not None:
+            validators.clear()
+            if response.headers.get('ETag'):
+                validators['etag'] = response.headers['ETag']
+            if response.headers.get('Last-Modified'):
+                validators['last_modified'] = response.headers['Last-Modified']
+        return parse_listing(response.content)
+
+    def check_response(self, status_code, final_url, label, subreddit=None):
+        """Log and record an unusable listing response; True if it can be parsed"""
+        if status_code == 200 and '/subreddits/search' not in str(final_url):
+            return True
+
+        if status_code == 200:
+            # Reddit redirects unknown subreddit names to the search page
+            outcome = health.NOT_FOUND
+        elif status_code == 404:
+            outcome = health.NOT_FOUND
+        elif status_code == 403:
+            outcome = health.FORBIDDEN
+        else:
+            outcome = health.ERROR
+        logger.error(f"Error fetching {label}: Status code {status_code} ({outcome})")
+        if subreddit:
+            self.health.record(subreddit, outcome)
+        return False
+
+    def fetch_page(self, subreddit, after=None):
+        """Fetch one page of the hot listing into the subreddit's reservoir.
+
+        A page fetched with an ``after`` cursor is appended to the reservoir,
+        the first page replaces it. Returns the extracted posts, or None if
+        the request failed.
+        """
+        return self.fetch_page_data(subreddit, after)[0]
+
+    def fetch_page_data(self, subreddit, after=None, merge=False):
+        """fetch_page, returning (posts, parsed listing); (None, None) if the request failed"""
+        try:
+            data = self.get_listing(self.page_path(subreddit, after), f"r/{subreddit}", subreddit)
+            return self.store_page(subreddit, data, after, merge), data
+        except Exception as e:
+            logger.error(f"Error in fetch_page for r/{subreddit}: {e}")
+            FETCH_ERRORS.inc('page')
+            self.health.record(subreddit, health.ERROR)
+            return None, None
+
+    def refresh_page(self, subreddit):
+        """Fetch only the posts that are new at the top of a subreddit's listing.
+
+        Asks for the posts ranked before the watermark, the top post of the
+        last first-page fetch (``before=``), with the ETag and Last-Modified
+        of the previous refresh so that an unchanged listing costs a 304 and
+        nothing to parse. New posts go to the front of the reservoir. Without
+        a watermark, or once it was recorded more than ``watermark_max_age``
+        ago and the post may have dropped out of the listing (when
+        ``before=`` only ever returns nothing), the first page is refetched
+        in full and merged into the reservoir the same way. Returns the new
+        posts, or None if the request failed.
+        """
+        watermark = self.cache.watermark(subreddit)
+        if not watermark or time.time() - watermark_age(watermark) > self.watermark_max_age:
+            return self.fetch_page_data(subreddit, merge=True)[0]
+
+        validators = {key: watermark[key] for key in ('etag', 'last_modified') if watermark.get(key)}
+        try:
+            path = self.page_path(subreddit, before=watermark['name'])
+            data = self.get_listing(path, f"r/{subreddit}", subreddit, validators)
+            return self.store_new(subreddit, data, watermark, validators)
         except Exception as e:
-            logger.error(f"Error in get_post for r/{subreddit}: {e}")
+            logger.error(f"Error in refresh_page for r/{subreddit}: {e}")
+            FETCH_ERRORS.inc('page')
+            self.health.record(subreddit, health.ERROR)
+            return None
+
+    def store_new(self, subreddit, data, watermark, validators):
+        """Put the posts of a before= listing at the front of the reservoir"""
+        if data is None:
+            return None
+
+        self.health.record(subreddit, health.OK)
+        if data == NOT_MODIFIED:
+            logger.debug(f"r/{subreddit} not modified since {watermark['name']}")
+            self.cache.merge_new(subreddit, [], watermark)
+            return []
+
+        children = data.get('data', {}).get('children') or []
+        posts = self.extract_children(children, subreddit)
+        # Validators belong to the URL they came from, which moves with the watermark
+        top = listing_watermark(children)
+        self.cache.merge_new(subreddit, posts, top or dict(watermark, **validators))
+        logger.debug(f"Refreshed r/{subreddit}: {len(posts)} new posts before {watermark['name']}")
+        return posts
+
+    def page_path(self, subreddit, after=None, before=None):
+        path = f"{subreddit}/hot.json?limit={self.page_size}"
+        if after:
+            path += f"&after={after}"
+        if before:
+            path += f"&before={before}"
+        return path
+
+    def extract_children(self, children, subreddit):
+        """Posts for the unseen, non-stickied children of a listing"""
+        posts = []
+        for post in children:
+            post_data = post.get('data')
+            if post_data and not post_data.get('stickied', False) and not self.is_seen(post_data):
+                extracted_data = self.extract_post_data(post_data, subreddit)
+                if extracted_data:
+                    posts.append(extracted_data)
+        return posts
+
+    def store_page(self, subreddit, data, after=None, merge=False):
+        """Extract a fetched listing page and put it in the subreddit's reservoir
+
+        With ``merge`` set, a first page goes in front of the reservoir
+        instead of replacing it.
+        """
+        if data is None:
             return None
 
+        listing = data.get('data', {})
+        if not listing.get('children'):
+            logger.info(f"No posts found in r/{subreddit}")
+            if not after:
+                self.health.record(subreddit, health.EMPTY)
+            return []
+
+        posts = self.extract_children(listing['children'], subreddit)
+        # A page of posts that were all seen or unusable counts as empty
+        self.health.record(subreddit, health.OK if posts else health.EMPTY)
+        watermark = None if after else listing_watermark(listing['children'])
+        if merge and not after:
+            watermark = watermark or self.cache.watermark(subreddit)
+            self.cache.merge_new(subreddit, posts, watermark, after=listing.get('after'))
+        else:
+            self.cache.put(subreddit, posts, after=listing.get('after'), append=bool(after), watermark=watermark)
+        logger.debug(f"Fetched {len(posts)} posts from r/{subreddit} (after={after})")
+        return posts
+
+    def fetch_pages(self, subreddits):
+        """Fetch the first page of every subreddit; returns subreddit -> posts"""
+        return {subreddit: self.fetch_page(subreddit) for subreddit in subreddits}
+
+    def batch_chunks(self, subreddits, limit):
+        """Split subreddits into multireddit paths that fit in MAX_URL_LENGTH"""
+        overhead = len(f"{self.base_url}/r//hot.json?limit={limit}")
+        chunk, length = [], overhead
+        for subreddit in subreddits:
+            extra = len(subreddit) + (1 if chunk else 0)
+            if chunk and length + extra > MAX_URL_LENGTH:
+                yield chunk
+                chunk, length = [], overhead
+                extra = len(subreddit)
+            chunk.append(subreddit)
+            length += extra
+        if chunk:
+            yield chunk
+
+    def fetch_batch(self, subreddits, limit=100):
+        """Fetch many subreddits through /r/a+b+c/hot.json and split the result.
+
+        Posts are grouped back by subreddit and stored in the cache, so later
+        get_post calls for these subreddits are served without a request.
+        Returns a subreddit -> posts dict; subreddits that got no posts in the
+        combined listing are left out and fall back to per-subreddit fetches.
+        """
+        by_subreddit = {}
+        watermarks = {}
+        for chunk in self.batch_chunks(subreddits, limit):
+            names = {s.lower(): s for s in chunk}
+            label = f"multireddit of {len(chunk)} subreddits"
+            try:
+                data = self.get_listing(f"{'+'.join(chunk)}/hot.json?limit={limit}", label)
+            except Exception as e:
+                logger.error(f"Error fetching {label}: {e}")
+                FETCH_ERRORS.inc('batch')
+                continue
+            if data is None:
+                continue
+
+            for child in data.get('data', {}).get('children', []):
+                post_data = child.get('data')
+                if not post_data or post_data.get('stickied', False):
+                    continue
+                subreddit = names.get(str(post_data.get('subreddit', '')).lower())
+                if not subreddit:
+                    continue
+                if subreddit not in watermarks:
+                    watermarks[subreddit] = listing_watermark([child])
+                if self.is_seen(post_data):
+                    continue
+                extracted_data = self.extract_post_data(post_data, subreddit)
+                if extracted_data:
+                    by_subreddit.setdefault(subreddit, []).append(extracted_data)
+
+        for subreddit, posts in by_subreddit.items():
+            self.cache.put(subreddit, posts, watermark=watermarks.get(subreddit))
+        logger.info(f"Batch fetched {sum(map(len, by_subreddit.values()))} posts for "
+                    f"{len(by_subreddit)}/{len(subreddits)} subreddits")
+        return by_subreddit
+
     def unescape_url(self, url):
         """Convert HTML entities back to original characters in URLs"""
-        if not url:
-            return url
-        return url.replace('&amp;', '&')
+        return unescape_url(url)
 
+    @EXTRACT_SECONDS.time()
     def extract_post_data(self, post_data, subreddit):
         try:
-            media_url = ''
-            gallery_images = []
-            logger.debug(f"\n=== VIDEO DEBUG ===")
-            
             # Basic validation
             if not isinstance(post_data, dict):
                 logger.error("Invalid post data format")
@@ -97,169 +398,78 @@ class RedditFetcher:
                 media = post_data.get('media', {})
                 url = post_data.get('url', '')
 
-            logger.debug(f"Post URL: {url}")
-            logger.debug(f"Is Video: {is_video}")
-            logger.debug(f"Media Data: {media}")
-            
-            # Handle v.redd.it videos
-            dash_url = None
-            if is_video and isinstance(media, dict):
-                reddit_video = media.get('reddit_video', {})
-                if reddit_video:
-                    # Get the DASH playlist URL
-                    dash_url = reddit_video.get('dash_url')
-                    if not dash_url and 'fallback_url' in reddit_video:
-                        # Construct DASH URL from fallback URL if not provided
-                        base_url = reddit_video['fallback_url'].split('DASH_')[0]
-                        dash_url = f"{base_url}DASHPlaylist.mpd"
-                    
-                    # Keep the fallback URL as backup
-                    media_url = reddit_video.get('fallback_url', '')
-
-            # Check if the post is a gallery
-            if post_data.get('is_gallery', False):
-                media_metadata = post_data.get('media_metadata', {})
-                for media_id, media_info in media_metadata.items():
-                    if media_info.get('e') == 'Image':
-                        image_url = media_info['s']['u']
-                        gallery_images.append(self.unescape_url(image_url))
-
-            # If no video URL found, use the post URL only if it's not a self post
-            if not media_url and not post_data.get('is_self', False):
-                media_url = self.unescape_url(url) if url else ''
-            
-            logger.debug(f"Final media URL: {media_url}")
-            logger.debug("=== VIDEO DEBUG END ===\n")
-
-            # Convert selftext markdown to HTML
-            selftext = post_data.get('selftext', '')
-            if selftext:
-                import re
-                
-                logger.debug("\n=== NUMBERED LIST PROCESSING START ===")
-                logger.debug(f"Original text:\n{selftext}")
-                
-                # Process numbered lists first
-                lines = selftext.split('\n')
-                in_list = False
-                list_buffer = []
-                processed_lines = []
-                current_list_number = 0
-                
-                for line in lines:
-                    line = line.strip()
-                    # Check for numbered list item
-                    list_match = re.match(r'^\s*(\d+)\.\s+(.+)$', line)
-                    
-                    if list_match:
-                        number = int(list_match.group(1))
-                        content = list_match.group(2)
-                        logger.debug(f"Found list item: number={number}, content={content}")
-                        
-                        # Start new list only if we're not in one or if number is less than current
-                        if not in_list or number <= current_list_number:
-                            if in_list:
-                                processed_lines.append('</ol>')
-                            processed_lines.append('<ol>')
-                            in_list = True
-                            
-                        current_list_number = number
-                        list_buffer.append(content)
-                        processed_lines.append(f'<li>{content}</li>')
-                        logger.debug(f"Added list item {number}")
-                    elif line == '' and not in_list:
-                        # Only add empty lines when we're not in a list
-                        processed_lines.append(line)
-                    elif line != '' and in_list:
-                        # Non-empty, non-list line ends the list
-                        logger.debug("Ending list due to non-list content")
-                        in_list = False
-                        processed_lines.append('</ol>')
-                        processed_lines.append(line)
-                    else:
-                        processed_lines.append(line)
-                
-                if in_list:
-                    logger.debug("Closing final list")
-                    processed_lines.append('</ol>')
-                
-                selftext = '\n'.join(processed_lines)
-                logger.debug(f"\nProcessed HTML:\n{selftext}")
-                logger.debug("=== NUMBERED LIST PROCESSING END ===\n")
-                
-                # Continue with other markdown conversions
-                # Headers
-                selftext = re.sub(r'(?m)^# (.*?)$', r'<h1>\1</h1>', selftext)
-                selftext = re.sub(r'(?m)^## (.*?)$', r'<h2>\1</h2>', selftext)
-                selftext = re.sub(r'(?m)^### (.*?)$', r'<h3>\1</h3>', selftext)
-                
-                # Bold and Italic
-                selftext = re.sub(r'\*\*\*(.*?)\*\*\*', r'<strong><em>\1</em></strong>', selftext)
-                selftext = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', selftext)
-                selftext = re.sub(r'\*(.*?)\*', r'<em>\1</em>', selftext)
-                
-                # Strikethrough
-                selftext = re.sub(r'~~(.*?)~~', r'<del>\1</del>', selftext)
-                
-                # Spoilers
-                selftext = re.sub(r'>!(.*?)!<', r'<span class="spoiler">\1</span>', selftext)
-                
-                # Unordered lists (unchanged)
-                selftext = re.sub(r'(?m)^[*-] (.*?)$', r'<ul><li>\1</li></ul>', selftext)
-                
-                # Blockquotes
-                selftext = re.sub(r'(?m)^> (.*?)$', r'<blockquote>\1</blockquote>', selftext)
-                
-                # Code blocks
-                selftext = re.sub(r'```(.*?)```', r'<pre><code>\1</code></pre>', selftext, flags=re.DOTALL)
-                selftext = re.sub(r'`(.*?)`', r'<code>\1</code>', selftext)
-                
-                # Links - handle both [text](url) and plain URLs
-                selftext = re.sub(
-                    r'\[([^\]]+)\]\(([^\)]+)\)', 
-                    r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', 
-                    selftext
-                )
-                selftext = re.sub(
-                    r'(?<!href=")(?<![\(\[])(https?://[^\s\)<>]+)', 
-                    r'<a href="\1" target="_blank" rel="noopener noreferrer">\1</a>', 
-                    selftext
-                )
-                
-                # Line breaks
-                selftext = selftext.replace('\n\n', '<br><br>')
-                
-                # Superscript
-                selftext = re.sub(r'\^(.*?)(?=\s|$)', r'<sup>\1</sup>', selftext)
-
-            # Create post data dictionary with safe defaults and unescape URLs
-            post_data_dict = {
-                'title': post_data.get('title', ''),
-                'url': f"https://www.reddit.com{post_data.get('permalink', '')}",
-                'score': str(post_data.get('score', '0')),
-                'subreddit': subreddit,
-                'media_url': self.unescape_url(media_url),
-                'gallery_images': gallery_images,
-                'thumbnail': self.unescape_url(post_data.get('thumbnail', '')),
-                'author': post_data.get('author', '[deleted]'),
-                'num_comments': post_data.get('num_comments', 0),
-                'selftext': selftext,
-                'is_self': post_data.get('is_self', False),
-                'created_utc': post_data.get('created_utc', 0),
-                'domain': post_data.get('domain', ''),
-                'external_url': self.unescape_url(url) if not post_data.get('is_self', False) else '',
-                'post_hint': post_data.get('post_hint', ''),
-                'is_video': is_video,
-                'dash_url': self.unescape_url(dash_url) if dash_url else None,
-            }
-            
-            return post_data_dict
+            resolved = self.media.resolve(post_data, url, media, is_video)
+            if logger.isEnabledFor(logging.DEBUG):
+                # Formatting the media dict is costly, skip it unless it is logged
+                logger.debug(f"\n=== VIDEO DEBUG ===")
+                logger.debug(f"Post URL: {url}")
+                logger.debug(f"Is Video: {is_video}")
+                logger.debug(f"Media Data: {media}")
+                logger.debug(f"Final media URL: {resolved['media_url']}")
+                logger.debug("=== VIDEO DEBUG END ===\n")
+
+            # Create the post with safe defaults and unescape URLs
+            return Post(
+                id=post_data.get('name', ''),
+                title=post_data.get('title', ''),
+                url=f"https://www.reddit.com{post_data.get('permalink', '')}",
+                score=str(post_data.get('score', '0')),
+                subreddit=subreddit,
+                media_url=resolved['media_url'],
+                preview_url=resolved['preview_url'],
+                preview_srcset=resolved['preview_srcset'],
+                media_width=resolved['media_width'],
+                media_height=resolved['media_height'],
+                gallery_images=resolved['gallery_images'],
+                gallery_sizes=resolved['gallery_sizes'],
+                gallery_srcsets=resolved['gallery_srcsets'],
+                thumbnail=self.unescape_url(post_data.get('thumbnail', '')),
+                author=post_data.get('author', '[deleted]'),
+                num_comments=post_data.get('num_comments', 0),
+                selftext=post_data.get('selftext', ''),  # Raw markdown, rendered lazily by Post
+                is_self=post_data.get('is_self', False),
+                created_utc=post_data.get('created_utc', 0),
+                domain=post_data.get('domain', ''),
+                external_url=self.unescape_url(url) if not post_data.get('is_self', False) else '',
+                post_hint=post_data.get('post_hint', ''),
+                is_video=is_video,
+                dash_url=resolved['dash_url'],
+            )
 
         except Exception as e:
             logger.error(f"Error extracting post data: {e}")
             logger.error(f"Post data that caused error: {post_data}")
             return None
 
+def conditional_headers(validators):
+    """If-None-Match / If-Modified-Since headers for stored response validators"""
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def listing_watermark(children):
+    """Fullname and created_utc of the top non-stickied child, stamped with now, or None"""
+    for child in children:
+        post_data = child.get('data') or {}
+        if post_data.get('name') and not post_data.get('stickied', False):
+            return {
+                'name': post_data['name'],
+                'created_utc': float(post_data.get('created_utc') or 0),
+                'recorded_at': time.time(),
+            }
+    return None
+
+
+def watermark_age(watermark):
+    """When the watermark was recorded, or its post's created_utc for older cache entries"""
+    return watermark.get('recorded_at') or watermark.get('created_utc', 0)
+
+
 def get_subreddits_from_url(url):
     """Extract subreddits from a Reddit URL"""
     url = url.lstrip('@')
@@ -278,150 +488,399 @@ def get_subreddits_from_url(url):
     return subreddits
 
 class RedditQueue:
-    def __init__(self, buffer_size=3):
-        self.fetcher = RedditFetcher()
+    """Prefetched posts from the configured subreddits, shared by every viewer.
+
+    Posts move from the background prefetcher's ready queue into ``feed``, an
+    append-only log in which every post has a sequence number. Viewers only
+    hold a cursor (a sequence number) into the feed, so any number of them
+    can browse concurrently without refetching; whoever reaches the head
+    first publishes the next ready post for everyone. All state is guarded by
+    one lock.
+
+    Which subreddit the next post comes from is up to ``scheduler`` (see
+    scheduler.py); ``current_index`` counts the claims made in the current
+    pass over the list.
+    """
+
+    def __init__(self, buffer_size=3, prefetch_size=5, prefetch_workers=2, fetcher=None, feed_size=500,
+                 scheduler=None):
+        self.fetcher = fetcher or RedditFetcher()
         self.buffer_size = buffer_size
-        self.current_posts = []
+        self.scheduler = scheduler or WeightedScheduler()
         self.subreddits = []
+        self.positions = {}  # subreddit -> index in subreddits
         self.current_index = 0
         self.load_subreddits()
-        self.retry_delay = 3
-        self.max_retries = 3
         self.last_fetched_index = -1
         self.min_buffer_size = 2  # Current post + 2 next posts
-        logger.debug(f"Initialized RedditQueue with buffer_size={buffer_size}, min_buffer_size={self.min_buffer_size}")
+
+        # Background prefetch state
+        self.prefetch_size = prefetch_size  # Posts kept ready ahead of the cursor
+        self.prefetch_workers = prefetch_workers
+        self.ready_timeout = 15  # Max seconds a request waits for an empty ready queue
+        self.ready_posts = deque()
+        self._queued_keys = set()  # Keys of everything in the feed and ready_posts
+        self._lock = threading.RLock()
+        self._ready_changed = threading.Condition(self._lock)
+        self._inflight = 0
+        self._batch_due = True  # Warm the cache with multireddit requests on the next pass
+        self._stop_event = threading.Event()
+        self._executor = None
+        self._prefetch_thread = None
+
+        # Shared feed of published posts; viewers keep a cursor into it
+        self.generation = uuid.uuid4().hex[:8]  # Lets viewers notice the queue was replaced
+        self.feed = deque(maxlen=feed_size)
+        self.feed_start = 0  # Sequence number of feed[0]
+        logger.debug(f"Initialized RedditQueue with buffer_size={buffer_size}, min_buffer_size={self.min_buffer_size}, prefetch_size={prefetch_size}")
+
+    @property
+    def feed_head(self):
+        """Sequence number the next published post will get"""
+        return self.feed_start + len(self.feed)
 
     def get_current_posts(self):
-        """Return the current posts in the buffer"""
-        return self.current_posts
+        """Return the most recently published posts, up to buffer_size"""
+        with self._lock:
+            return list(self.feed)[-self.buffer_size:]
+
+    def start_prefetch(self):
+        """Start the background worker that keeps posts ready ahead of the cursor"""
+        with self._lock:
+            if self._prefetch_thread and self._prefetch_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers,
+                                                thread_name_prefix='reddit-prefetch')
+            self._prefetch_thread = threading.Thread(target=self._prefetch_loop,
+                                                     name='reddit-prefetch-dispatch',
+                                                     daemon=True)
+            self._prefetch_thread.start()
+            logger.debug("Prefetch worker started")
+
+    def warm_up(self):
+        """Queue cached posts for immediate serving, then start the prefetcher.
+
+        Only the post cache is read here, so on a restart the first posts are
+        ready within milliseconds; the prefetcher fetches the rest.
+        """
+        for subreddit in list(self.subreddits):
+            with self._lock:
+                if len(self.ready_posts) >= self.prefetch_size:
+                    break
+            try:
+                post, _ = self.fetcher.pop_unseen(subreddit)
+            except Exception as e:
+                logger.error(f"WARM UP ERROR for r/{subreddit}: {e}")
+                continue
+            with self._ready_changed:
+                if post and not self._is_duplicate(post):
+                    self.ready_posts.append(post)
+                    self._queued_keys.add(post.key)
+                    self._ready_changed.notify_all()
+        logger.debug(f"Warm up queued {len(self.ready_posts)} cached posts")
+        self.start_prefetch()
+
+    def stop_prefetch(self):
+        """Stop the background worker; in-flight fetches are allowed to finish"""
+        with self._ready_changed:
+            self._stop_event.set()
+            self._ready_changed.notify_all()
+            executor = self._executor
+            self._executor = None
+        if executor:
+            executor.shutdown(wait=False)
+        logger.debug("Prefetch worker stopped")
+
+    def _prefetch_loop(self):
+        """Dispatch fetches until the ready queue holds prefetch_size posts"""
+        while not self._stop_event.is_set():
+            if self._batch_due:
+                self._batch_due = False
+                self._warm_cache()
+
+            with self._ready_changed:
+                while not self._stop_event.is_set() and not self._needs_prefetch():
+                    self._ready_changed.wait(timeout=1)
+                if self._stop_event.is_set():
+                    break
+                subreddit = self._claim_next_subreddit()
+                if subreddit is None:
+                    # Every subreddit is on a health cooldown
+                    self._ready_changed.wait(timeout=5)
+                    continue
+                self._inflight += 1
+                executor = self._executor
 
-    def initialize_buffer(self):
-        """Initial fetch of posts to fill the buffer"""
-        logger.debug(f"=== INITIALIZE BUFFER START ===")
-        logger.debug(f"Target buffer size: {self.buffer_size}")
-        self.current_posts = []
-        
-        while len(self.current_posts) < self.buffer_size and self.current_index < len(self.subreddits):
             try:
-                logger.debug(f"Fetching initial post... (current size: {len(self.current_posts)})")
-                new_post = self.fetch_next_post()
-                if new_post:
-                    self.current_posts.append(new_post)
-                    logger.debug(f"Added initial post from r/{new_post['subreddit']}")
+                if self.fetcher.is_async:
+                    # A coroutine on the fetcher's event loop rather than a blocked thread
+                    self.fetcher.submit(self._prefetch_one_async(subreddit))
                 else:
-                    logger.debug("Failed to fetch initial post")
-                time.sleep(1)  # Rate limiting
+                    executor.submit(self._prefetch_one, subreddit)
+            except (RuntimeError, AttributeError):
+                # Executor was shut down between the claim and the submit
+                with self._ready_changed:
+                    self._inflight -= 1
+                break
+
+    def _warm_cache(self):
+        """Fill the cache for stale, drained subreddits with a few multireddit requests
+
+        Stale subreddits that still have posts and a watermark are left out;
+        their next visit refreshes them incrementally.
+        """
+        cache = self.fetcher.cache
+        subreddits = list(self.subreddits)
+        stock = cache.stock(subreddits)
+        stale = [s for s in subreddits
+                 if not cache.is_fresh(s) and not (s in stock and cache.watermark(s))]
+        if len(stale) > 1:
+            try:
+                self.fetcher.fetch_batch(stale)
             except Exception as e:
-                logger.error(f"Error during initialization: {e}")
-        
-        logger.debug(f"=== INITIALIZE BUFFER END ===")
-        logger.debug(f"Buffer initialized with {len(self.current_posts)} posts: {[p['subreddit'] for p in self.current_posts]}")
-        return self.current_posts
-
-    def advance_queue(self):
-        """Remove oldest post and fetch new posts to maintain buffer"""
-        logger.debug(f"\n=== ADVANCE QUEUE START ===")
-        logger.debug(f"BEFORE - Current index: {self.current_index}")
-        logger.debug(f"BEFORE - Buffer size: {len(self.current_posts)}")
-        logger.debug(f"BEFORE - Posts in buffer: {[p['subreddit'] for p in self.current_posts]}")
-        logger.debug(f"BEFORE - Total subreddits: {len(self.subreddits)}")
-        
-        if not self.current_posts:
-            logger.debug("Buffer empty, initializing...")
-            return self.initialize_buffer()
-
-        # Her zaman bir sonraki postu fetch et
-        try:
-            logger.debug(f"Attempting to fetch next post at index {self.current_index}")
-            new_post = self.fetch_next_post()
-            if new_post:
-                self.current_posts.append(new_post)
-                logger.debug(f"SUCCESS: Added new post from r/{new_post['subreddit']}")
-                logger.debug(f"New buffer size: {len(self.current_posts)}")
-            else:
-                logger.debug(f"FAILED: Could not fetch post at index {self.current_index}")
-        except Exception as e:
-            logger.error(f"ERROR during fetch: {str(e)}")
-
-        # En eski postu kaldır
-        if len(self.current_posts) > self.buffer_size:
-            removed = self.current_posts.pop(0)
-            logger.debug(f"Removed oldest post from r/{removed['subreddit']}")
-            logger.debug(f"After removal - Buffer size: {len(self.current_posts)}")
-
-        # Buffer boşsa ve subredditler bittiyse reset at
-        if not self.current_posts and self.current_index >= len(self.subreddits):
-            logger.debug("Resetting queue - reached end of subreddits")
-            self.current_index = 0
-            return self.initialize_buffer()
-
-        logger.debug(f"\n=== ADVANCE QUEUE END ===")
-        logger.debug(f"AFTER - Current index: {self.current_index}")
-        logger.debug(f"AFTER - Buffer size: {len(self.current_posts)}")
-        logger.debug(f"AFTER - Posts in buffer: {[p['subreddit'] for p in self.current_posts]}")
-        return self.current_posts
-
-    def fetch_next_post(self, retries=0):
-        """Fetch a post from the next subreddit"""
-        if self.current_index >= len(self.subreddits):
-            logger.debug(f"FETCH: Index {self.current_index} exceeds subreddit count {len(self.subreddits)}")
+                logger.error(f"Error warming cache: {e}")
+
+    def _needs_prefetch(self):
+        # Async fetches cost no thread each, so they are bounded by prefetch_size alone
+        workers = self.prefetch_size if self.fetcher.is_async else self.prefetch_workers
+        return (self.subreddits
+                and self._inflight < workers
+                and len(self.ready_posts) + self._inflight < self.prefetch_size)
+
+    def _claim_next_subreddit(self):
+        """Return (index, subreddit) picked by the scheduler, or None if all are cooling down
+
+        Every len(subreddits) claims count as one pass, after which the cache
+        is warmed again.
+        """
+        subreddit = self.scheduler.next(self.subreddits, self.fetcher)
+        if subreddit is None:
             return None
+        self.current_index += 1
+        if self.current_index >= len(self.subreddits):
+            logger.debug("Prefetch completed a pass over the subreddits")
+            self.current_index = 0
+            self._batch_due = True
+        return self.positions.get(subreddit, -1), subreddit
 
-        subreddit = self.subreddits[self.current_index]
-        logger.debug(f"\nFETCH: Attempting r/{subreddit} at index {self.current_index}")
-        
+    def _prefetch_one(self, claim):
+        _, subreddit = claim
+        post = None
         try:
-            time.sleep(self.retry_delay)
             post = self.fetcher.get_post(subreddit)
-            
             if post:
-                if any(existing['url'] == post['url'] for existing in self.current_posts):
-                    logger.debug(f"FETCH: Post from r/{subreddit} already in buffer, skipping")
-                    self.current_index += 1
-                    return self.fetch_next_post(retries)
-                
-                logger.debug(f"FETCH: Successfully got post from r/{subreddit}")
-                self.last_fetched_index = self.current_index
-                self.current_index += 1
-                self.retry_delay = 3
-                return post
-            
-            logger.debug(f"FETCH: No post available from r/{subreddit}")
-            self.current_index += 1
-            return self.fetch_next_post(retries)
+                # HEAD-check the media here so viewers never wait on it
+                self.fetcher.media.preflight(post)
+        except Exception as e:
+            logger.error(f"PREFETCH ERROR for r/{subreddit}: {e}")
+        self._prefetched(subreddit, post)
 
+    async def _prefetch_one_async(self, claim):
+        _, subreddit = claim
+        post = None
+        try:
+            post = await self.fetcher.get_post_async(subreddit)
+            if post:
+                await self.fetcher.preflight_async(post)
         except Exception as e:
-            logger.error(f"FETCH ERROR for r/{subreddit}: {e}")
-            if "429" in str(e) and retries < self.max_retries:
-                wait_time = self.retry_delay * (2 ** retries)
-                logger.warning(f"Rate limited. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-                return self.fetch_next_post(retries + 1)
-            
-            self.current_index += 1
-            return self.fetch_next_post(retries)
+            logger.error(f"PREFETCH ERROR for r/{subreddit}: {e}")
+        self._prefetched(subreddit, post)
+
+    def _prefetched(self, subreddit, post):
+        """Hand a finished prefetch's post to the ready queue"""
+        with self._ready_changed:
+            self._inflight -= 1
+            if post and subreddit not in self.positions:
+                logger.debug(f"PREFETCH: r/{subreddit} was removed while its post was fetched")
+            elif post and not self._is_duplicate(post):
+                self.ready_posts.append(post)
+                self._queued_keys.add(post.key)
+                self.last_fetched_index = self.positions[subreddit]
+                logger.debug(f"PREFETCH: Ready post from r/{subreddit} ({len(self.ready_posts)} ready)")
+            else:
+                logger.debug(f"PREFETCH: No usable post from r/{subreddit}")
+            self._ready_changed.notify_all()
+
+    def _is_duplicate(self, post):
+        """Already published, already prefetched, or shown in an earlier session"""
+        return post.key in self._queued_keys or post.key in self.fetcher.seen
+
+    def _publish(self, post):
+        """Append a post to the feed and record it as seen (in memory, post_at flushes it)"""
+        if len(self.feed) == self.feed.maxlen:
+            evicted = self.feed.popleft()
+            self.feed_start += 1
+            self._queued_keys.discard(evicted.key)
+        self.feed.append(post)
+        self._queued_keys.add(post.key)
+        self.fetcher.seen.add(post.key)
+        logger.debug(f"Published post {self.feed_head - 1} from r/{post.subreddit}")
+
+    def post_at(self, seq, timeout=None):
+        """Return (seq, post) for a viewer's cursor.
+
+        When the cursor is at the head of the feed, the next ready post is
+        published, waiting up to timeout seconds for the prefetcher. A cursor
+        that fell off the start of the feed is moved to the oldest post kept,
+        one past the head is moved back to it: only the head is ever
+        published, so no caller can mark posts seen that nobody was shown.
+        post is None if nothing became ready in time.
+        """
+        self.start_prefetch()
+        if timeout is None:
+            timeout = self.ready_timeout
+        deadline = time.time() + timeout
+        try:
+            with self._ready_changed:
+                seq = min(max(seq, self.feed_start), self.feed_head)
+                while seq >= self.feed_head:
+                    if self.ready_posts:
+                        self._publish(self.ready_posts.popleft())
+                        self._ready_changed.notify_all()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self.subreddits:
+                        return seq, None
+                    self._ready_changed.wait(timeout=remaining)
+                return seq, self.feed[seq - self.feed_start]
+        finally:
+            # Published posts were only marked seen in memory, write them out off the lock
+            self.fetcher.seen.maybe_flush()
+
+    def window(self, start, count, timeout=None):
+        """Return (start, posts) for up to count posts from start on"""
+        posts = []
+        seq = start
+        while len(posts) < count:
+            seq, post = self.post_at(seq, timeout)
+            if not post:
+                break
+            if not posts:
+                start = seq
+            posts.append(post)
+            seq += 1
+        return start, posts
+
+    def initialize_buffer(self):
+        """Make sure the feed holds at least buffer_size posts"""
+        logger.debug(f"=== INITIALIZE BUFFER START ===")
+        self.window(max(0, self.feed_head - self.buffer_size), self.buffer_size)
+        posts = self.get_current_posts()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Buffer initialized with {len(posts)} posts: {[p.subreddit for p in posts]}")
+        return posts
+
+    def advance_queue(self):
+        """Publish the next prefetched post and return the latest buffer_size posts"""
+        logger.debug(f"BEFORE - Feed head: {self.feed_head}, ready posts: {len(self.ready_posts)}")
+        _, new_post = self.post_at(self.feed_head)
+        if not new_post:
+            logger.debug("FAILED: No prefetched post became ready in time")
+        return self.get_current_posts()
+
+    def read_subreddits(self):
+        """(subreddits, weights) from the subreddits file; weights are optional, 1 if left out"""
+        with open(SUBREDDITS_FILE, 'r') as f:
+            data = json.load(f)
+        return data['subreddits'], data.get('weights')
 
     def load_subreddits(self):
         """Load subreddits from file"""
         try:
-            with open(SUBREDDITS_FILE, 'r') as f:
-                data = json.load(f)
-                self.subreddits = data['subreddits']
-                logger.info(f"Loaded {len(self.subreddits)} subreddits")
+            self.subreddits, weights = self.read_subreddits()
+            self.scheduler.set_weights(weights)
+            logger.info(f"Loaded {len(self.subreddits)} subreddits")
         except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
             logger.error(f"Error loading subreddits file: {e}")
             self.subreddits = []
+        self.positions = {subreddit: index for index, subreddit in enumerate(self.subreddits)}
+
+    def reload_subreddits(self):
+        """Apply a changed subreddits file to the running queue; returns (added, removed)
+
+        The feed, viewers' cursors, the prefetcher and every cached or ready
+        post of a subreddit that stays are kept. Ready posts of removed
+        subreddits are dropped, and in-flight fetches for them are discarded
+        when they finish. Added subreddits are warmed with a multireddit fetch
+        in the background, so this returns without touching the network.
+        Raises the file's error if it cannot be read.
+        """
+        subreddits, weights = self.read_subreddits()
+        with self._ready_changed:
+            kept = set(subreddits)
+            added = [s for s in subreddits if s not in self.positions]
+            removed = [s for s in self.subreddits if s not in kept]
+            self.subreddits = subreddits
+            self.positions = {subreddit: index for index, subreddit in enumerate(subreddits)}
+            self.scheduler.set_weights(weights)
+            self.current_index = min(self.current_index, max(0, len(subreddits) - 1))
+
+            dropped = [post for post in self.ready_posts if post.subreddit not in kept]
+            if dropped:
+                self.ready_posts = deque(post for post in self.ready_posts if post.subreddit in kept)
+                self._queued_keys.difference_update(post.key for post in dropped)
+            self._ready_changed.notify_all()
+
+        for subreddit in removed:
+            self.fetcher.health.forget(subreddit)
+        logger.info(f"Reloaded subreddits: {len(added)} added, {len(removed)} removed, "
+                    f"{len(dropped)} ready posts dropped")
+
+        cache = self.fetcher.cache
+        uncached = [s for s in added if not cache.is_fresh(s)]
+        if uncached:
+            threading.Thread(target=self._warm_subreddits, args=(uncached,),
+                             name='reddit-warm-new', daemon=True).start()
+        return added, removed
+
+    def _warm_subreddits(self, subreddits):
+        try:
+            self.fetcher.fetch_batch(subreddits)
+        except Exception as e:
+            logger.error(f"Error warming new subreddits: {e}")
+        with self._ready_changed:
+            self._ready_changed.notify_all()
 
     def get_progress(self):
         """Get progress information"""
+        with self._lock:
+            return self._progress()
+
+    def _progress(self):
         return {
             'current_index': self.current_index,
             'total_subreddits': len(self.subreddits),
-            'buffer_size': len(self.current_posts),
+            'buffer_size': min(len(self.feed), self.buffer_size),
             'remaining_subreddits': len(self.subreddits) - self.current_index,
-            'last_fetched': self.last_fetched_index
+            'last_fetched': self.last_fetched_index,
+            'ready_posts': len(self.ready_posts),
+            'feed_head': self.feed_head,
+            'skipped_subreddits': len(self.fetcher.health.unavailable()),
+            'rate_limit': self.fetcher.rate_limiter.metrics()
         }
 
+def create_fetcher():
+    """Blocking requests client by default; REDDIT_HTTP_CLIENT=async selects httpx.
+
+    REDDIT_BASE_URL points the app at another server, e.g. benchmarks/fake_reddit.py.
+    """
+    base_url = os.environ.get('REDDIT_BASE_URL', REDDIT_BASE_URL)
+    if os.environ.get('REDDIT_HTTP_CLIENT') == 'async':
+        from async_fetcher import AsyncRedditFetcher
+        return AsyncRedditFetcher(base_url=base_url)
+    return RedditFetcher(base_url=base_url)
+
+
+def create_scheduler():
+    """Weighted by default; SUBREDDIT_SCHEDULER=round_robin walks the list in order"""
+    name = os.environ.get('SUBREDDIT_SCHEDULER', 'weighted')
+    if name not in SCHEDULERS:
+        logger.warning(f"Unknown SUBREDDIT_SCHEDULER {name!r}, using weighted")
+        name = 'weighted'
+    return SCHEDULERS[name]()
+
+
 def main():
     # This main function can be removed if this file is only used as a module
     pass
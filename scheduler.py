@@ -0,0 +1,95 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Decides which subreddit the queue fetches its next post from.
+
+    ``next`` is called with the queue's lock held and returns a subreddit, or
+    None when every subreddit is on a health cooldown. ``weights`` maps
+    subreddit -> relative weight (default 1, 0 to mute), from the optional
+    ``weights`` object in subreddits.json.
+    """
+
+    def __init__(self, weights=None):
+        self.weights = dict(weights or {})
+
+    def set_weights(self, weights):
+        self.weights = dict(weights or {})
+
+    def next(self, subreddits, fetcher):
+        raise NotImplementedError
+
+
+class RoundRobinScheduler(Scheduler):
+    """Subreddits in list order, one post each, wrapping around at the end.
+
+    Ignores the cache; muted (weight 0) and cooling-down subreddits are skipped.
+    """
+
+    def __init__(self, weights=None):
+        super().__init__(weights)
+        self.position = 0
+
+    def next(self, subreddits, fetcher):
+        for _ in range(len(subreddits)):
+            subreddit = subreddits[self.position % len(subreddits)]
+            self.position = (self.position + 1) % len(subreddits)
+            if self.weights.get(subreddit, 1) > 0 and fetcher.health.is_available(subreddit):
+                return subreddit
+            logger.debug(f"Skipping r/{subreddit}, muted or on health cooldown")
+        return None
+
+
+class WeightedScheduler(Scheduler):
+    """Smooth weighted round-robin over the healthy subreddits.
+
+    A subreddit's share of the turns is its configured weight times its
+    health score, multiplied by ``cached_boost`` while its reservoir in the
+    post cache still holds posts (``stale_boost`` once they are past the
+    TTL). Cached posts are displayable without a request, so the rate budget
+    goes to the subreddits that need one only as fast as the rotation
+    reaches them. Picks interleave the way nginx balances upstreams rather
+    than running in blocks, and every healthy subreddit keeps at least
+    ``min_score`` of its weight, so none is starved.
+    """
+
+    def __init__(self, weights=None, cached_boost=4.0, stale_boost=2.0, min_score=0.1):
+        super().__init__(weights)
+        self.cached_boost = cached_boost
+        self.stale_boost = stale_boost
+        self.min_score = min_score
+        self.current = {}  # subreddit -> running credit
+
+    def weight(self, subreddit, stock, health):
+        weight = self.weights.get(subreddit, 1) * max(health.score(subreddit), self.min_score)
+        cached = stock.get(subreddit)
+        if cached:
+            weight *= self.cached_boost if cached[1] else self.stale_boost
+        return weight
+
+    def next(self, subreddits, fetcher):
+        stock = fetcher.cache.stock(subreddits)
+        total = 0
+        best = None
+        for subreddit in subreddits:
+            if not fetcher.health.is_available(subreddit):
+                continue
+            weight = self.weight(subreddit, stock, fetcher.health)
+            if weight <= 0:
+                continue
+            self.current[subreddit] = self.current.get(subreddit, 0) + weight
+            total += weight
+            if best is None or self.current[subreddit] > self.current[best]:
+                best = subreddit
+        if best is None:
+            return None
+        self.current[best] -= total
+        return best
+
+
+SCHEDULERS = {
+    'weighted': WeightedScheduler,
+    'round_robin': RoundRobinScheduler,
+}
@@ -0,0 +1,109 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SEEN_DB = 'seen_posts.db'
+
+
+class SeenIndex:
+    """Ids of posts that were already shown, kept across restarts.
+
+    Membership checks hit an in-memory set; every id is also written to a
+    small SQLite table so the set can be rebuilt at startup. ``add`` only
+    touches memory, since it runs under the queue's lock; new ids are
+    written in one transaction by ``maybe_flush`` once ``flush_size`` are
+    pending or the last write is ``flush_interval`` seconds old, and by
+    ``flush`` at exit. Entries older than ``max_age`` seconds are dropped
+    when the table is loaded, so a post can come back once it is old news.
+    With ``path=None`` nothing is persisted.
+    """
+
+    def __init__(self, path=SEEN_DB, max_age=30 * 86400, flush_size=50, flush_interval=5):
+        self.path = path
+        self.max_age = max_age
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.ids = set()
+        self._pending = []  # (id, seen_at) not written yet
+        self._last_flush = time.time()
+        self._conn = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # The connection is shared between threads
+        atexit.register(self.flush)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, seen_at REAL)')
+            self._conn.execute('DELETE FROM seen WHERE seen_at < ?', (time.time() - self.max_age,))
+            self._conn.commit()
+            self.ids.update(row[0] for row in self._conn.execute('SELECT id FROM seen'))
+            logger.info(f"Loaded {len(self.ids)} seen posts from {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Error opening seen index {self.path}: {e}")
+            self._conn = None
+
+    def __contains__(self, post_id):
+        with self._lock:
+            self._ensure_loaded()
+            return post_id in self.ids
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self.ids)
+
+    def add(self, post_id):
+        """Mark a post as seen; it is written to disk by the next flush"""
+        if not post_id:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            if post_id in self.ids:
+                return
+            self.ids.add(post_id)
+            if self._conn is not None:
+                self._pending.append((post_id, time.time()))
+
+    def maybe_flush(self):
+        """Write pending ids if enough piled up or the last write is old; call without other locks held"""
+        if self._pending and (len(self._pending) >= self.flush_size
+                              or time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._last_flush = time.time()
+            if not pending or self._conn is None:
+                return
+            try:
+                self._conn.executemany('INSERT OR REPLACE INTO seen (id, seen_at) VALUES (?, ?)', pending)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error recording {len(pending)} seen posts: {e}")
+
+    def clear(self):
+        with self._write_lock:
+            with self._lock:
+                self._ensure_loaded()
+                self.ids.clear()
+                self._pending.clear()
+                if self._conn is not None:
+                    self._conn.execute('DELETE FROM seen')
+                    self._conn.commit()
+
+
+# One index for the whole process, opened on first use
+shared_seen = SeenIndex()
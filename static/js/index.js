@@ -0,0 +1,705 @@
+// Initial posts and feed position, rendered into the page by the index route
+const viewerState = JSON.parse(document.getElementById('viewer-state').textContent);
+
+let currentPost = viewerState.currentPost;
+let posts = [];
+
+// Position in the server's shared feed, see /posts
+const PREFETCH_AHEAD = 5;
+const MAX_BATCH_SIZE = viewerState.maxBatchSize;
+let feedId = viewerState.feedId;
+let feedCursor = viewerState.feedCursor;
+let prefetching = null;
+let postWaiters = [];
+let lastFetchError = null;
+
+// Add keyboard navigation
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'ArrowRight') {
+        showNextPost();
+    } else if (event.key === 'ArrowLeft') {
+        showPreviousPost();
+    }
+});
+
+function showPreviousPost() {
+    console.log('Showing previous post');
+    if (currentPost > 0) {
+        hideAllPosts();
+        currentPost--;
+        showPost(currentPost);
+        updateCounter();
+        updateNavigationButtons();
+    }
+}
+
+async function showNextPost() {
+    console.log('\n=== showNextPost START ===');
+    console.log('Current post index:', currentPost);
+    console.log('Total posts in buffer:', posts.length);
+
+    const nextButton = document.getElementById('nextButton');
+
+    // Only wait on the server when the prefetched window has run dry
+    if (currentPost >= posts.length - 1) {
+        nextButton.disabled = true;
+        await waitForNewPosts();
+        nextButton.disabled = false;
+        if (currentPost >= posts.length - 1) {
+            showErrorMessage(lastFetchError || 'No more posts available');
+            return;
+        }
+    }
+
+    hideAllPosts();
+    currentPost++;
+    showPost(currentPost);
+    updateCounter();
+    updateNavigationButtons();
+
+    // Keep PREFETCH_AHEAD posts buffered ahead of the one on screen
+    prefetchPosts();
+
+    console.log('=== showNextPost END ===');
+    console.log('New post index:', currentPost);
+    console.log('New total posts:', posts.length);
+}
+
+function prefetchPosts() {
+    // One request at a time; callers share the in-flight promise
+    const wanted = PREFETCH_AHEAD - (posts.length - 1 - currentPost);
+    if (!prefetching && wanted > 0) {
+        const request = window.EventSource ? streamPostWindow(wanted)
+                                           : fetchPostWindow(Math.min(wanted, MAX_BATCH_SIZE));
+        prefetching = request.finally(() => {
+            prefetching = null;
+            notifyPostWaiters();
+        });
+    }
+    return prefetching || Promise.resolve();
+}
+
+function waitForNewPosts() {
+    // Resolves as soon as one more post arrives, or when the request ends empty-handed
+    const arrived = new Promise(resolve => postWaiters.push(resolve));
+    prefetchPosts();
+    if (!prefetching) {
+        notifyPostWaiters();
+    }
+    return arrived;
+}
+
+function notifyPostWaiters() {
+    postWaiters.forEach(resolve => resolve());
+    postWaiters = [];
+}
+
+function receivePosts(newPosts) {
+    const firstPosts = posts.length === 0;
+    lastFetchError = null;
+    posts.push(...newPosts);
+    appendNewPosts(newPosts);
+    if (firstPosts) {
+        // First posts on the page, either from the initial state or streamed in
+        hideLoadingIndicator();
+        showPost(currentPost);
+        updateNavigationButtons();
+    }
+    updateCounter();
+    notifyPostWaiters();
+}
+
+function streamPostWindow(count) {
+    // Posts are pushed one by one as the server's prefetcher produces them
+    return new Promise(resolve => {
+        console.log(`Streaming ${count} posts from cursor ${feedCursor}`);
+        const source = new EventSource(`/stream?feed=${feedId}&cursor=${feedCursor}&count=${count}`);
+
+        source.addEventListener('post', event => {
+            feedCursor = Number(event.lastEventId) + 1;
+            receivePosts([JSON.parse(event.data)]);
+        });
+        source.addEventListener('done', event => {
+            const data = JSON.parse(event.data);
+            feedId = data.feed;
+            feedCursor = data.next_cursor;
+            if (data.error) {
+                lastFetchError = data.error;
+            }
+            updateProgress(data.progress);
+            source.close();
+            resolve();
+        });
+        source.onerror = () => {
+            // Closing stops EventSource from reconnecting on its own
+            source.close();
+            lastFetchError = 'Error showing next post';
+            resolve();
+        };
+    });
+}
+
+async function fetchPostWindow(count) {
+    try {
+        console.log(`Fetching ${count} posts from cursor ${feedCursor}`);
+        const response = await fetch(`/posts?feed=${feedId}&cursor=${feedCursor}&count=${count}`);
+        const data = await response.json();
+
+        if (data.success && data.posts.length > 0) {
+            feedId = data.feed;
+            feedCursor = data.next_cursor;
+            receivePosts(data.posts);
+            updateProgress(data.progress);
+        } else {
+            lastFetchError = data.error;
+        }
+    } catch (error) {
+        console.error('Error fetching posts:', error);
+        lastFetchError = 'Error showing next post';
+    }
+}
+
+function showLoadingIndicator() {
+    const postsContainer = document.querySelector('.posts-container');
+    if (!postsContainer) {
+        console.error('Posts container not found');
+        return;
+    }
+
+    const existing = document.querySelector('.loading-indicator');
+    if (!existing) {
+        const loadingIndicator = document.createElement('div');
+        loadingIndicator.className = 'loading-indicator';
+        loadingIndicator.innerHTML = '<div class="spinner"></div> Loading next posts...';
+        postsContainer.appendChild(loadingIndicator);
+    }
+}
+
+function hideLoadingIndicator() {
+    const loadingIndicator = document.querySelector('.loading-indicator');
+    if (loadingIndicator) {
+        loadingIndicator.remove();
+    }
+}
+
+function updateNavigationButtons() {
+    const prevButton = document.getElementById('prevButton');
+    const nextButton = document.getElementById('nextButton');
+
+    if (prevButton) {
+        prevButton.disabled = currentPost === 0;
+    }
+
+    if (nextButton) {
+        nextButton.disabled = false; // Always enable next button as we're fetching new posts
+    }
+}
+
+function showPost(index) {
+    console.log(`Showing post ${index}`);
+    const postContainers = document.querySelectorAll('.post-container');
+    postContainers.forEach((container, i) => {
+        container.style.display = i === index ? 'block' : 'none';
+        if (i === index) {
+            container.classList.add('active');
+        } else {
+            container.classList.remove('active');
+        }
+    });
+}
+
+function hideAllPosts() {
+    document.querySelectorAll('.post-container').forEach(container => {
+        container.style.display = 'none';
+    });
+}
+
+function createPostElement(post) {
+    const postDiv = document.createElement('div');
+    postDiv.className = 'post-container';
+
+    postDiv.innerHTML = `
+        <div class="post">
+            <h2>${escapeHtml(post.title)}</h2>
+            <p class="subreddit">r/${post.subreddit}</p>
+            <div class="post-info">
+                <span>Score: ${post.score}</span>
+                <span>Comments: ${post.num_comments}</span>
+                <span>By: ${escapeHtml(post.author)}</span>
+            </div>
+            ${post.selftext ? `<div class="post-content">${escapeHtml(post.selftext)}</div>` : ''}
+            ${post.media_url ? `
+                <div class="media-container">
+                    ${post.thumbnail && post.thumbnail !== 'self' ? 
+                        `<img src="${escapeHtml(post.thumbnail)}" alt="Post thumbnail">` : ''}
+                    <a href="${escapeHtml(post.media_url)}" target="_blank">View Media</a>
+                </div>
+            ` : ''}
+            <a href="${escapeHtml(post.url)}" target="_blank" class="post-link">View on Reddit</a>
+        </div>
+    `;
+
+    return postDiv;
+}
+
+function updatePostsDisplay(newPosts) {
+    console.log('Updating posts display:', newPosts);
+    const postsContainer = document.querySelector('.posts-container');
+    postsContainer.innerHTML = ''; // Clear existing posts
+
+    newPosts.forEach(post => {
+        const postElement = createPostElement(post);
+        postsContainer.appendChild(postElement);
+    });
+
+    posts = newPosts;
+    hideAllPosts();
+    showPost(currentPost);
+    console.log('Posts updated, showing post:', currentPost);
+}
+
+function updateCounter() {
+    const counter = document.getElementById('postCounter');
+    if (counter && posts.length > 0) {
+        counter.textContent = `Post ${currentPost + 1} of ${posts.length}`;
+    }
+}
+
+function updateProgress(progress) {
+    const progressInfo = document.querySelector('.progress-info');
+    const bufferInfo = document.querySelector('.buffer-info');
+
+    if (progressInfo) {
+        progressInfo.textContent = 
+            `Showing posts ${progress.current_index - progress.buffer_size + 1} 
+             to ${progress.current_index} of ${progress.total_subreddits}`;
+    }
+
+    if (bufferInfo) {
+        bufferInfo.textContent = `Buffer: ${progress.buffer_size}/5 posts`;
+    }
+}
+
+function showErrorMessage(message) {
+    const postsContainer = document.querySelector('.posts-container');
+    if (!postsContainer) {
+        console.error('Posts container not found');
+        return;
+    }
+
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'alert alert-info';
+    messageDiv.textContent = message;
+    postsContainer.insertBefore(messageDiv, postsContainer.firstChild);
+
+    // Remove message after 5 seconds
+    setTimeout(() => messageDiv.remove(), 5000);
+}
+
+function escapeHtml(unsafe) {
+    if (!unsafe) return '';
+    return unsafe
+        .replace(/&/g, "&amp;")
+        .replace(/</g, "&lt;")
+        .replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;")
+        .replace(/'/g, "&#039;");
+}
+
+// Initialize on page load
+document.addEventListener('DOMContentLoaded', () => {
+    updateNavigationButtons();
+    if (viewerState.posts.length > 0) {
+        receivePosts(viewerState.posts);
+    } else {
+        showLoadingIndicator();
+    }
+    prefetchPosts();
+});
+
+function timeSince(date) {
+    var seconds = Math.floor((new Date() - date) / 1000);
+    var interval = seconds / 31536000;
+
+    if (interval > 1) return Math.floor(interval) + " years ago";
+    interval = seconds / 2592000;
+    if (interval > 1) return Math.floor(interval) + " months ago";
+    interval = seconds / 86400;
+    if (interval > 1) return Math.floor(interval) + " days ago";
+    interval = seconds / 3600;
+    if (interval > 1) return Math.floor(interval) + " hours ago";
+    interval = seconds / 60;
+    if (interval > 1) return Math.floor(interval) + " minutes ago";
+    return Math.floor(seconds) + " seconds ago";
+}
+
+function toggleSelftext(index) {
+    const selftext = document.getElementById(`selftext-${index}`);
+    const button = selftext.nextElementSibling;
+
+    if (selftext.classList.contains('collapsed')) {
+        selftext.classList.remove('collapsed');
+        button.textContent = 'Show less';
+    } else {
+        selftext.classList.add('collapsed');
+        button.textContent = 'Show more';
+    }
+}
+
+function filterSubreddits() {
+    const input = document.querySelector('.search-box');
+    const filter = input.value.toLowerCase();
+    const items = document.querySelectorAll('.subreddit-item');
+
+    items.forEach(item => {
+        const text = item.textContent.toLowerCase();
+        item.style.display = text.includes(filter) ? '' : 'none';
+    });
+}
+
+function filterBySubreddit(subreddit) {
+    const posts = document.querySelectorAll('.post-container');
+    const subredditItems = document.querySelectorAll('.subreddit-item');
+
+    // Update active state
+    subredditItems.forEach(item => {
+        item.classList.remove('active');
+        if (subreddit === 'all' && item.textContent.includes('All Subreddits') ||
+            item.textContent.includes(`r/${subreddit}`)) {
+            item.classList.add('active');
+        }
+    });
+
+    // Filter posts
+    posts.forEach(post => {
+        if (subreddit === 'all' || post.querySelector('.subreddit-badge').textContent === `r/${subreddit}`) {
+            post.style.display = '';
+        } else {
+            post.style.display = 'none';
+        }
+    });
+
+    // Reset post counter
+    currentPost = 0;
+    const visiblePosts = Array.from(posts).filter(post => post.style.display !== 'none');
+    if (visiblePosts.length > 0) {
+        hideAllPosts();
+        showPost(0);
+    }
+    updateCounter();
+}
+
+function copyUrl() {
+    const urlInput = document.querySelector('.url-input');
+    urlInput.select();
+    document.execCommand('copy');
+
+    // Show feedback
+    const copyButton = document.querySelector('.copy-button');
+    const originalText = copyButton.textContent;
+    copyButton.textContent = 'Copied!';
+    setTimeout(() => {
+        copyButton.textContent = originalText;
+    }, 2000);
+}
+
+function updatePostsDisplay(newPosts) {
+    console.log('Updating posts display with:', newPosts.length, 'posts');
+    const postsContainer = document.querySelector('.posts-container');
+
+    // Clear existing posts
+    postsContainer.innerHTML = '';
+
+    // Add new posts
+    newPosts.forEach((post, index) => {
+        const postDiv = document.createElement('div');
+        postDiv.className = 'post-container';
+        postDiv.style.display = index === currentPost ? 'block' : 'none';
+
+        postDiv.innerHTML = `
+            <div class="post">
+                <h2>${escapeHtml(post.title)}</h2>
+                <p class="subreddit">r/${post.subreddit}</p>
+                <div class="post-info">
+                    <span>Score: ${post.score}</span>
+                    <span>Comments: ${post.num_comments}</span>
+                    <span>By: ${escapeHtml(post.author)}</span>
+                </div>
+                ${post.selftext ? `<div class="post-content">${escapeHtml(post.selftext)}</div>` : ''}
+                ${post.media_url ? `
+                    <div class="media-container">
+                        ${post.thumbnail && post.thumbnail !== 'self' ? 
+                            `<img src="${escapeHtml(post.thumbnail)}" alt="Post thumbnail">` : ''}
+                        <a href="${escapeHtml(post.media_url)}" target="_blank">View Media</a>
+                    </div>
+                ` : ''}
+                <a href="${escapeHtml(post.url)}" target="_blank" class="post-link">View on Reddit</a>
+            </div>
+        `;
+
+        postsContainer.appendChild(postDiv);
+    });
+
+    // Update global posts array
+    posts = newPosts;
+
+    console.log('Posts display updated. Current post:', currentPost);
+}
+
+// Add this helper function for safe HTML escaping
+function escapeHtml(unsafe) {
+    if (!unsafe) return '';
+    return unsafe
+        .replace(/&/g, "&amp;")
+        .replace(/</g, "&lt;")
+        .replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;")
+        .replace(/'/g, "&#039;");
+}
+
+function showErrorMessage(message) {
+    const postsContainer = document.querySelector('.posts-container');
+    if (!postsContainer) {
+        console.error('Posts container not found');
+        return;
+    }
+
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'alert alert-info';
+    messageDiv.textContent = message;
+    postsContainer.insertBefore(messageDiv, postsContainer.firstChild);
+
+    // Remove message after 5 seconds
+    setTimeout(() => messageDiv.remove(), 5000);
+}
+
+function sizeAttributes(size) {
+    // Lets the browser reserve the image's space before it has loaded
+    if (!size || !size[0] || !size[1]) {
+        return '';
+    }
+    return ` width="${size[0]}" height="${size[1]}"`;
+}
+
+function srcsetAttributes(srcset) {
+    // Lets the browser pick the preview rendition for its viewport; the column is at most 800px wide
+    if (!srcset) {
+        return '';
+    }
+    return ` srcset="${escapeHtml(srcset)}" sizes="(max-width: 800px) 100vw, 800px"`;
+}
+
+function appendNewPosts(newPosts) {
+    console.log('\n=== DEBUG: appendNewPosts START ===');
+    console.log('Post data:', newPosts);
+    const postsContainer = document.querySelector('.posts-container');
+
+    newPosts.forEach((post, index) => {
+        console.log(`\nProcessing post ${index + 1}:`,{
+            title: post.title,
+            subreddit: post.subreddit,
+            is_self: post.is_self,
+            external_url: post.external_url,
+            url: post.url
+        });
+
+        const postDiv = document.createElement('div');
+        postDiv.className = 'post-container';
+        const postIndex = posts.length - newPosts.length + index;
+        postDiv.id = `post-${postIndex}`;
+        postDiv.style.display = 'none';
+
+        const isImage = post.is_image;  // Decided by the server, the media proxy hides the extension
+        console.log('Is image?', isImage);
+
+        // Broken media (failed the server's HEAD check) is left out, the link card is shown instead
+        const mediaOk = post.media_ok !== false;
+        const imageUrl = post.preview_url || post.external_url;
+
+        // Only show external URL if it's different from the post URL
+        const showExternalUrl = post.external_url && post.external_url !== post.url;
+        console.log('Show external URL?', showExternalUrl, {
+            external_url: post.external_url,
+            post_url: post.url
+        });
+
+        postDiv.innerHTML = `
+            <span class="subreddit-badge">r/${post.subreddit}</span>
+            <div class="post-title">
+                <a href="${post.url}" target="_blank">${escapeHtml(post.title)}</a>
+            </div>
+
+            <div class="post-content">
+                ${post.is_self && post.selftext_html ? `
+                    <div class="post-selftext">${post.selftext_html}</div>
+                ` : ''}
+
+                ${mediaOk && post.is_video && post.media_url ? (post.dash_url ? `
+                    <div class="post-video-container">
+                        <video-js
+                            id="video-${postIndex}"
+                            class="video-js vjs-default-skin vjs-big-play-centered"
+                            controls
+                            preload="auto">
+                            <source src="${post.dash_url}" type="application/dash+xml"/>
+                        </video-js>
+                    </div>
+                ` : `
+                    <div class="post-video-container">
+                        <video 
+                            class="post-video" 
+                            controls 
+                            preload="metadata"
+                            poster="${post.thumbnail}"
+                            style="width: 100%; max-height: 80vh; background: #000;">
+                            <source src="${post.media_url}" type="video/mp4">
+                            Your browser does not support the video tag.
+                        </video>
+                    </div>
+                `) : mediaOk && post.gallery_images && post.gallery_images.length > 0 ? `
+                    <div class="gallery-container" id="gallery-${postIndex}">
+                        ${post.gallery_images.map((image, i) => `
+                            <div class="gallery-slide" style="display: ${i === 0 ? 'block' : 'none'};">
+                                <img src="${image}" class="post-image" alt="Gallery image ${i + 1}"${sizeAttributes(post.gallery_sizes && post.gallery_sizes[i])}${srcsetAttributes(post.gallery_srcsets && post.gallery_srcsets[i])}>
+                                <div class="gallery-counter">${i + 1} / ${post.gallery_images.length}</div>
+                            </div>
+                        `).join('')}
+                        ${post.gallery_images.length > 1 ? `
+                            <button class="gallery-nav prev" onclick="changeSlide(-1, ${postIndex})">❮</button>
+                            <button class="gallery-nav next" onclick="changeSlide(1, ${postIndex})">❯</button>
+                        ` : ''}
+                    </div>
+                ` : showExternalUrl ? 
+                    isImage && mediaOk ? `
+                        <img src="${imageUrl}" class="post-image" alt="Post image"${sizeAttributes([post.media_width, post.media_height])}${post.preview_url ? srcsetAttributes(post.preview_srcset) : ''}>
+                    ` : `
+                        <a href="${post.external_url}" class="post-link-header" target="_blank">
+                            <span class="post-domain">${post.domain}</span>
+                            <span class="post-url">${post.external_url}</span>
+                        </a>
+                    `
+                : ''}
+            </div>
+
+            <div class="post-meta">
+                <span class="score">↑ ${post.score}</span>
+                <span class="post-author">u/${post.author}</span>
+                <span class="post-comments">
+                    <svg style="width: 16px; height: 16px;" viewBox="0 0 24 24">
+                        <path fill="currentColor" d="M20,2H4A2,2 0 0,0 2,4V22L6,18H20A2,2 0 0,0 22,16V4A2,2 0 0,0 20,2M20,16H6L4,18V4H20V16Z" />
+                    </svg>
+                    ${post.num_comments} comments
+                </span>
+                <span class="post-time">${timeSince(post.created_utc * 1000)}</span>
+            </div>
+        `;
+
+        console.log('Created post HTML:', postDiv.innerHTML);
+        postsContainer.appendChild(postDiv);
+        initializeVideoPlayers(postDiv);
+    });
+
+    console.log('=== DEBUG: appendNewPosts END ===\n');
+}
+
+function fetchPosts() {
+    // ... existing code ...
+    posts.forEach(post => {
+        const postDiv = document.createElement('div');
+        postDiv.className = 'post-container';
+
+        // Check if the post has an image link
+        const imageUrl = post.preview ? post.preview.images[0].source.url : null;
+        const linkImageUrl = post.url.includes('redd.it') ? post.url.replace('https://www.reddit.com', 'https://external-preview.redd.it') : null;
+
+        postDiv.innerHTML = `
+            <h2>${post.title}</h2>
+            ${imageUrl ? `<img src="${imageUrl}" alt="Post image" />` : ''}
+            ${!imageUrl && linkImageUrl ? `<img src="${linkImageUrl}" alt="Link image" />` : ''}
+            <div class="post-meta">
+                <span class="score">↑ ${post.score}</span>
+                <span class="post-author">u/${post.author}</span>
+                <span class="post-comments">
+                    <svg style="width: 16px; height: 16px;" viewBox="0 0 24 24">
+                        <path fill="currentColor" d="M20,2H4A2,2 0 0,0 2,4V22L6,18H20A2,2 0 0,0 22,16V4A2,2 0 0,0 20,2M20,16H6L4,18V4H20V16Z" />
+                    </svg>
+                    ${post.num_comments} comments
+                </span>
+                <span class="post-time">${timeSince(post.created_utc * 1000)}</span>
+            </div>
+        `;
+
+        postsContainer.appendChild(postDiv);
+    });
+}
+
+let currentSlides = {};
+
+function changeSlide(direction, galleryId) {
+    const gallery = document.getElementById(`gallery-${galleryId}`);
+    const slides = gallery.getElementsByClassName('gallery-slide');
+
+    if (!currentSlides[galleryId]) {
+        currentSlides[galleryId] = 0;
+    }
+
+    // Hide current slide
+    slides[currentSlides[galleryId]].style.display = "none";
+
+    // Calculate new slide index
+    currentSlides[galleryId] += direction;
+
+    // Loop back to start/end if needed
+    if (currentSlides[galleryId] >= slides.length) {
+        currentSlides[galleryId] = 0;
+    }
+    if (currentSlides[galleryId] < 0) {
+        currentSlides[galleryId] = slides.length - 1;
+    }
+
+    // Show new slide
+    slides[currentSlides[galleryId]].style.display = "block";
+}
+
+// Add keyboard navigation for galleries
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'ArrowLeft') {
+        const visibleGallery = document.querySelector('.post-container.active .gallery-container');
+        if (visibleGallery) {
+            const galleryId = visibleGallery.id.split('-')[1];
+            changeSlide(-1, galleryId);
+        }
+    } else if (event.key === 'ArrowRight') {
+        const visibleGallery = document.querySelector('.post-container.active .gallery-container');
+        if (visibleGallery) {
+            const galleryId = visibleGallery.id.split('-')[1];
+            changeSlide(1, galleryId);
+        }
+    }
+});
+
+function initializeVideoPlayers(root) {
+    root.querySelectorAll('video-js').forEach(videoElement => {
+        const player = videojs(videoElement.id, {
+            controls: true,
+            autoplay: false,
+            preload: 'auto',
+            fluid: true,
+            html5: {
+                dash: {
+                    limitBitrateByPortal: true
+                }
+            }
+        });
+
+        player.on('error', function() {
+            const error = player.error();
+            if (error) {
+                const errorDiv = document.createElement('div');
+                errorDiv.className = 'alert alert-danger';
+                errorDiv.textContent = 'Error loading video. Please try again later.';
+                videoElement.parentNode.insertBefore(errorDiv, videoElement);
+            }
+        });
+    });
+}